@@ -12,3 +12,5 @@ __contact__ = 'karan@karanlyons.com'
 __homepage__ = 'https://github.com/karanlyons/django-save-the-change'
 __license__ = 'Apache 2.0'
 __copyright__ = 'Copyright 2013 Karan Lyons'
+
+default_app_config = 'save_the_change.apps.SaveTheChangeConfig'
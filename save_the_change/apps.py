@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+from threading import Lock
+
+from django.apps import AppConfig, apps
+from django.conf import settings
+from django.utils import six
+
+from . import decorators
+
+
+#: A :class:`dict` of models waiting to be decorated on first instantiation,
+#: mapped to the decorators to apply to them.
+PENDING_MODELS = {}
+
+_pending_lock = Lock()
+
+
+def _lazy_new(cls, *args, **kwargs):
+	"""
+	Stands in for :meth:`__new__` on models listed
+	in ``SAVE_THE_CHANGE_MODELS``, decorating them (and any pending models
+	they inherit from) just before their first instance is created.
+	
+	Classes that already inherit from a model once it's decorated (its
+	multi-table children, or Django < 1.10's deferred loading classes) missed
+	their chance to be decorated along with it when they were prepared, so
+	they're caught up then too.
+	
+	CPython won't let us cleanly remove an assigned :meth:`__new__` again, so
+	this stays in place afterwards, but only costs the one check.
+	
+	"""
+	
+	if PENDING_MODELS:
+		with _pending_lock:
+			for klass in reversed(cls.__mro__):
+				if klass in PENDING_MODELS:
+					for decorator in PENDING_MODELS[klass]:
+						decorator(klass)
+					
+					# Only once it's decorated, so that other threads wait on
+					# the lock rather than instantiating a half decorated model.
+					del(PENDING_MODELS[klass])
+					
+					_decorate_subclasses(klass)
+	
+	return object.__new__(cls)
+
+
+def _decorate_subclasses(cls):
+	for subclass in cls.__subclasses__():
+		decorators._inject_stc_into_subclass(subclass)
+		_decorate_subclasses(subclass)
+
+
+def install_lazily(model, decorators):
+	"""
+	Defers decorating ``model`` until it's first instantiated.
+	
+	:param model: the model to decorate.
+	:param decorators: an iterable of decorators to apply to it.
+	
+	"""
+	
+	with _pending_lock:
+		if model not in PENDING_MODELS and not hasattr(model._meta, '_stc_injected'):
+			PENDING_MODELS[model] = list(decorators)
+			model.__new__ = staticmethod(_lazy_new)
+
+
+class SaveTheChangeConfig(AppConfig):
+	"""
+	Installs tracking on the models listed in ``SAVE_THE_CHANGE_MODELS``.
+	
+	The setting is either an iterable of model labels, which are decorated
+	with :func:`~save_the_change.decorators.SaveTheChange`, or
+	a :class:`dict` mapping model labels to an iterable of the names of
+	decorators in :mod:`save_the_change.decorators` (or the decorators
+	themselves) to apply:
+		
+		>>> SAVE_THE_CHANGE_MODELS = {
+		... 	'roundtable.Knight': ('SaveTheChange', 'TrackChanges'),
+		... 	'roundtable.Squire': ('SaveTheChange',),
+		... }
+	
+	Rather than decorating every model at startup, each is only decorated just
+	before it's first instantiated, so models a process never uses cost
+	nothing.
+	
+	"""
+	
+	name = 'save_the_change'
+	verbose_name = 'Save The Change'
+	
+	def ready(self):
+		models = getattr(settings, 'SAVE_THE_CHANGE_MODELS', ())
+		
+		if not isinstance(models, dict):
+			models = {label: ('SaveTheChange',) for label in models}
+		
+		for label, model_decorators in six.iteritems(models):
+			install_lazily(apps.get_model(label), (
+				getattr(decorators, decorator) if isinstance(decorator, six.string_types) else decorator
+				for decorator in model_decorators
+			))
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.db import close_old_connections, connections
+from django.db.transaction import TransactionManagementError
+
+from .bulk import _execute_bulk_save, _plan_bulk_save
+from .decorators import STCMixin, _run_save_hooks
+
+
+__all__ = ('asave', 'abulk_save')
+
+
+#: The :class:`~concurrent.futures.Executor` database writes are run in, as
+#: Django's ORM isn't safe to call from the event loop itself. Each of its
+#: threads has its own connections, which are closed once they're past
+#: ``CONN_MAX_AGE`` (so after every write, by default), just as they would be
+#: at the end of a request. Replace it to change how many writes can be run
+#: at once.
+EXECUTOR = ThreadPoolExecutor(max_workers=4)
+
+
+def _check_not_in_atomic_block():
+	# The write runs on another thread's connection, so it would neither be
+	# rolled back with the caller's transaction nor see what it's done, and
+	# could deadlock waiting on the caller's row locks while the caller waits
+	# on it.
+	if any(connection.in_atomic_block for connection in connections.all()):
+		raise TransactionManagementError("Async saves can't be made inside an atomic block.")
+
+
+def _run_with_connections(func):
+	close_old_connections()
+	
+	try:
+		return func()
+	
+	finally:
+		close_old_connections()
+
+
+def _run_in_executor(func, *args, **kwargs):
+	return asyncio.get_event_loop().run_in_executor(EXECUTOR, partial(_run_with_connections, partial(func, *args, **kwargs)))
+
+
+async def asave(instance, *args, **kwargs):
+	"""
+	Async counterpart to :meth:`~django.db.models.Model.save`, available
+	as :meth:`asave` on decorated models.
+	
+	The save hooks are run on the event loop, so saves that turn out to have
+	nothing to write return without ever leaving it. Only the write itself is
+	handed off to :data:`EXECUTOR`. Models that override
+	:meth:`~django.db.models.Model.save` have the whole of it run there
+	instead, so the override isn't skipped.
+	
+	As the write is made on another thread's connection, it can't be part of
+	a transaction the caller has open, and calling it inside an atomic block
+	raises :exc:`~django.db.transaction.TransactionManagementError`.
+	
+	Usage:
+		>>> knight.title = 'King'
+		>>> await knight.asave()
+	
+	"""
+	
+	_check_not_in_atomic_block()
+	
+	if type(instance).save is not STCMixin.save:
+		await _run_in_executor(instance.save, *args, **kwargs)
+		
+		return
+	
+	continue_saving, args, kwargs = _run_save_hooks(instance, *args, **kwargs)
+	
+	if continue_saving:
+		await _run_in_executor(super(STCMixin, instance).save, *args, **kwargs)
+	
+	instance._reset_stc_state()
+
+
+async def abulk_save(instances, using=None, batch_size=None):
+	"""
+	Async counterpart to :func:`~save_the_change.bulk.bulk_save`.
+	
+	The save hooks for every instance are run on the event loop, and
+	everything that needs writing is then written in a single trip
+	to :data:`EXECUTOR`, or not at all if nothing changed. As
+	with :func:`asave`, it can't be called inside an atomic block.
+	
+	:return: The number of instances written.
+	:rtype: :class:`int`
+	
+	"""
+	
+	_check_not_in_atomic_block()
+	
+	saves, groups = _plan_bulk_save(instances)
+	
+	if not saves and not groups:
+		return 0
+	
+	return await _run_in_executor(_execute_bulk_save, saves, groups, using, batch_size)
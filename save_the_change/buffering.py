@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import atexit
+import logging
+from collections import Counter, defaultdict
+from threading import Event, Lock, Thread
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from django.utils import six
+
+from .util import DoesNotExist, chunked
+
+
+__all__ = ('CounterBuffer', 'BUFFER')
+
+
+logger = logging.getLogger(__name__)
+
+
+class CounterBuffer(object):
+	"""
+	Accumulates increments to counter fields in memory and writes them as \
+	grouped ``F()`` increments.
+	
+	Saves of models decorated with ``SaveTheChange(buffered=(...))`` that
+	change only buffered fields add the changes to :data:`BUFFER` instead of
+	being written, and a background thread flushes it every ``interval``
+	seconds, or sooner once ``max_size`` rows are waiting. Rows whose
+	counters have changed by the same amounts are written together.
+	
+	Buffered saves don't send :data:`~django.db.models.signals.pre_save`
+	or :data:`~django.db.models.signals.post_save`, and increments still
+	buffered when the process dies uncleanly are lost, so it's only meant for
+	counters that can afford to be a little behind (and, rarely, a little
+	low).
+	
+	:param interval: seconds between flushes, defaulting to
+		the ``SAVE_THE_CHANGE_BUFFER_INTERVAL`` setting or ``1``.
+		If :const:`None`, no thread is started and the buffer is only flushed
+		by calling :meth:`flush`.
+	:param max_size: number of rows to buffer before flushing early,
+		defaulting to the ``SAVE_THE_CHANGE_BUFFER_SIZE`` setting or ``1000``.
+	
+	"""
+	
+	def __init__(self, interval=DoesNotExist, max_size=None):
+		self.interval = interval
+		self.max_size = max_size
+		self.deltas = defaultdict(Counter)
+		self.lock = Lock()
+		self.thread = None
+		self.wake = Event()
+		self.stopping = False
+	
+	def add(self, model, using, pk, deltas):
+		"""
+		Buffers increments to a row's fields.
+		
+		:param model: the row's model.
+		:param using: the database alias the row's in.
+		:param pk: the row's primary key.
+		:param deltas: a :class:`dict` mapping field names to increments.
+		
+		"""
+		
+		with self.lock:
+			if self.thread is None and not self.stopping:
+				self.start()
+			
+			self.deltas[(model, using, pk)].update(deltas)
+			
+			if self.max_size and len(self.deltas) >= self.max_size:
+				self.wake.set()
+	
+	def flush(self):
+		"""
+		Writes everything buffered so far, with one UPDATE for each group of
+		rows whose fields have changed by the same amounts.
+		
+		:return: The number of rows written.
+		:rtype: :class:`int`
+		
+		"""
+		
+		with self.lock:
+			deltas, self.deltas = self.deltas, defaultdict(Counter)
+		
+		groups = defaultdict(list)
+		
+		for (model, using, pk), fields in six.iteritems(deltas):
+			fields = frozenset((name, delta) for name, delta in six.iteritems(fields) if delta)
+			
+			if fields:
+				groups[(model, using, fields)].append(pk)
+		
+		written = 0
+		
+		for (model, using, fields), pks in six.iteritems(groups):
+			try:
+				for batch in chunked(pks, connections[using].ops.bulk_batch_size(['pk'], pks) or len(pks)):
+					model._base_manager.using(using).filter(pk__in=batch).update(**{
+						name: F(name) + delta for name, delta in fields
+					})
+					
+					# As soon as it's written, so that if a later batch fails
+					# this one's not put back and written twice.
+					for pk in batch:
+						del(deltas[(model, using, pk)])
+					
+					written += len(batch)
+			
+			except Exception:
+				# Put back what we couldn't write so it's not lost.
+				with self.lock:
+					for key, unwritten in six.iteritems(deltas):
+						self.deltas[key].update(unwritten)
+				
+				raise
+		
+		return written
+	
+	def start(self):
+		"""
+		Starts the background thread, unless the interval is :const:`None`.
+		
+		"""
+		
+		if self.interval is DoesNotExist:
+			self.interval = getattr(settings, 'SAVE_THE_CHANGE_BUFFER_INTERVAL', 1)
+		
+		if self.max_size is None:
+			self.max_size = getattr(settings, 'SAVE_THE_CHANGE_BUFFER_SIZE', 1000)
+		
+		if self.interval is not None and self.thread is None:
+			self.thread = Thread(target=self._run, name='save_the_change.buffering')
+			self.thread.daemon = True
+			self.thread.start()
+	
+	def stop(self):
+		"""
+		Stops the background thread and flushes anything left in the buffer.
+		
+		This is registered with :mod:`atexit` for :data:`BUFFER`.
+		
+		"""
+		
+		self.stopping = True
+		self.wake.set()
+		
+		if self.thread is not None:
+			self.thread.join()
+			self.thread = None
+		
+		self.flush()
+	
+	def _run(self):
+		while not self.stopping:
+			self.wake.wait(self.interval)
+			self.wake.clear()
+			
+			try:
+				self.flush()
+			
+			except Exception:
+				logger.exception('Failed to flush buffered counters.')
+			
+			finally:
+				connections.close_all()
+
+
+#: The :class:`CounterBuffer` buffered saves go to.
+BUFFER = CounterBuffer()
+
+atexit.register(lambda: BUFFER.stop())
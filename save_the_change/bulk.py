@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+from collections import defaultdict
+from multiprocessing.pool import ThreadPool
+
+from django.db import connections, router, transaction
+from django.db.models import Case, F, Value, When
+
+from .decorators import _run_save_hooks, _swap_in_expressions
+from .util import DoesNotExist, chunked
+
+
+__all__ = ('bulk_save', 'parallel_bulk_save', 'sync_records')
+
+
+def _update_group(model, instances, update_fields, using, raw=False):
+	"""
+	Writes ``update_fields`` for a group of instances of the same model with a \
+	single UPDATE.
+	
+	Each column is set with a ``CASE`` over the instances' primary keys, which
+	is what :meth:`~django.db.models.Model.save` would have written for them
+	one at a time. As with :meth:`~django.db.models.Model.save_base`, ``raw``
+	writes the instances' values as is rather than
+	through :meth:`~django.db.models.Field.pre_save`.
+	
+	Also as with :meth:`~django.db.models.Model.save`,
+	a :func:`~save_the_change.decorators.RowVersion` field is incremented in
+	the database, buffered counters are written as increments,
+	and :func:`~save_the_change.decorators.Appendable` fields that have only
+	been appended to are written as concatenations.
+	
+	"""
+	
+	meta = model._meta
+	row_version = getattr(meta, '_stc_row_version', None)
+	fields = [
+		field for field in meta.concrete_fields
+		if not field.primary_key and (field.name in update_fields or field.attname in update_fields)
+	]
+	
+	if not fields:
+		return
+	
+	def value(field, instance):
+		if raw and field.attname == row_version:
+			return F(field.name) + 1
+		
+		return getattr(instance, field.attname) if raw else field.pre_save(instance, False)
+	
+	def expression(field, instance):
+		result = value(field, instance)
+		
+		return result if hasattr(result, 'resolve_expression') else Value(result, output_field=field)
+	
+	if not raw and (getattr(meta, '_stc_buffered', None) or getattr(meta, '_stc_appendable', None) or row_version):
+		swapped = [_swap_in_expressions(instance, {'update_fields': update_fields, 'using': using}) for instance in instances]
+	
+	else:
+		swapped = ()
+	
+	queryset = model._base_manager.using(using).filter(pk__in=[instance.pk for instance in instances])
+	
+	try:
+		if len(instances) == 1:
+			queryset.update(**{field.name: value(field, instances[0]) for field in fields})
+		
+		else:
+			queryset.update(**{
+				field.name: Case(
+					*[When(pk=instance.pk, then=expression(field, instance)) for instance in instances],
+					output_field=field
+				)
+				for field in fields
+			})
+	
+	finally:
+		for instance, values in zip(instances, swapped):
+			instance.__dict__.update(values)
+
+
+def bulk_save(instances, using=None, batch_size=None):
+	"""
+	Saves many instances at once, writing only what's changed.
+	
+	Each instance's ``update_fields`` is worked out by the same save hooks
+	:meth:`~django.db.models.Model.save` would run, and instances that share
+	the same set of changed fields are written together with one UPDATE per
+	``batch_size`` instances. Instances that haven't changed aren't written at
+	all, and those that can't be updated in place (new instances, or those
+	with a changed primary key) fall back to a regular
+	:meth:`~django.db.models.Model.save`.
+	
+	As with :meth:`~django.db.models.query.QuerySet.update`, the grouped
+	UPDATEs don't send :data:`~django.db.models.signals.pre_save`
+	or :data:`~django.db.models.signals.post_save`.
+	
+	:param instances: iterable of instances decorated
+		with :func:`~save_the_change.decorators.SaveTheChange`.
+	:param using: database alias to write to.
+	:param batch_size: maximum number of instances written per UPDATE.
+	
+	:return: The number of instances written.
+	:rtype: :class:`int`
+	
+	"""
+	
+	saves, groups = _plan_bulk_save(instances)
+	
+	return _execute_bulk_save(saves, groups, using, batch_size)
+
+
+def _plan_bulk_save(instances):
+	"""
+	Runs the save hooks for each instance, without touching the database.
+	
+	:return: (saves, groups), where ``saves`` is a :class:`list` of the
+		instances that need a regular :meth:`~django.db.models.Model.save` and
+		``groups`` maps ``(model, update_fields)`` to the instances that can be
+		written together.
+	:rtype: :class:`tuple`
+	
+	"""
+	
+	saves = []
+	groups = defaultdict(list)
+	
+	for instance in instances:
+		continue_saving, args, kwargs = _run_save_hooks(instance)
+		
+		if continue_saving and kwargs.get('update_fields') is None:
+			saves.append(instance)
+		
+		elif continue_saving and kwargs['update_fields']:
+			groups[(instance.__class__, frozenset(kwargs['update_fields']))].append(instance)
+		
+		else:
+			instance._reset_stc_state()
+	
+	return (saves, groups)
+
+
+def _execute_bulk_save(saves, groups, using=None, batch_size=None):
+	"""
+	Writes what :func:`_plan_bulk_save` worked out.
+	
+	:return: The number of instances written.
+	:rtype: :class:`int`
+	
+	"""
+	
+	written = 0
+	
+	for instance in saves:
+		instance.save(using=using)
+		written += 1
+	
+	for (model, update_fields), group in groups.items():
+		db = using or router.db_for_write(model, instance=group[0])
+		
+		with transaction.atomic(using=db, savepoint=False):
+			for batch in chunked(group, batch_size or len(group)):
+				_update_group(model, batch, update_fields, db)
+		
+		for instance in group:
+			instance._state.db = db
+			instance._reset_stc_state()
+		
+		written += len(group)
+	
+	return written
+
+
+def _save_partition(partition):
+	"""
+	Writes one partition for :func:`parallel_bulk_save` in its own \
+	transaction, and closes the thread's connection afterwards.
+	
+	:return: (instances, exception), where ``exception`` is :const:`None` if
+		the partition was written.
+	:rtype: :class:`tuple`
+	
+	"""
+	
+	model, update_fields, instances, using, batch_size, close = partition
+	db = using or router.db_for_write(model, instance=instances[0])
+	states = [_tracked_state(instance) for instance in instances] if update_fields is None else ()
+	
+	try:
+		with transaction.atomic(using=db):
+			if update_fields is None:
+				for instance in instances:
+					instance.save(using=db)
+			
+			else:
+				for batch in chunked(instances, batch_size or len(instances)):
+					_update_group(model, batch, update_fields, db)
+	
+	except Exception as exception:
+		# save() forgets the changes (and, for new instances, that they're
+		# new) before we know whether they were committed.
+		for instance, state in zip(instances, states):
+			_restore_tracked_state(instance, state)
+		
+		return (instances, exception)
+	
+	finally:
+		if close:
+			connections[db].close()
+	
+	# Only once committed, as the commit itself can fail.
+	if update_fields is not None:
+		for instance in instances:
+			instance._state.db = db
+			instance._reset_stc_state()
+	
+	return (instances, None)
+
+
+def _tracked_state(instance):
+	"""
+	Copies what :meth:`~django.db.models.Model.save` changes about \
+	an instance besides its fields' values, for :func:`_restore_tracked_state`.
+	
+	"""
+	
+	return (
+		instance._state.adding,
+		instance._state.db,
+		instance.__dict__.get(instance._meta.pk.attname, DoesNotExist),
+		dict(instance._changed_fields),
+		dict(instance._mutable_fields),
+		set(instance._mutability_checked),
+	)
+
+
+def _restore_tracked_state(instance, state):
+	"""
+	Puts back what :func:`_tracked_state` copied, so the instance can be \
+	saved again.
+	
+	"""
+	
+	adding, db, pk, changed_fields, mutable_fields, mutability_checked = state
+	
+	instance._state.adding = adding
+	instance._state.db = db
+	
+	if pk is DoesNotExist:
+		instance.__dict__.pop(instance._meta.pk.attname, None)
+	
+	else:
+		instance.__dict__[instance._meta.pk.attname] = pk
+	
+	instance._changed_fields = changed_fields
+	instance._mutable_fields = mutable_fields
+	instance._mutability_checked = mutability_checked
+	instance._stc_version += 1
+
+
+def parallel_bulk_save(instances, workers=4, partition_size=10000, using=None, batch_size=None):
+	"""
+	Saves a very large number of instances at once, writing only what's \
+	changed, with several connections at a time.
+	
+	Works as :func:`bulk_save` does, except that each group of instances with
+	the same changed fields is sorted by primary key and split into
+	partitions of ``partition_size`` instances, each covering its own range
+	of primary keys. Instances that need a regular save are split into
+	partitions of ``partition_size`` per model in the same way, in the order
+	they were given. The partitions are then written by ``workers`` threads,
+	each partition in its own transaction on the thread's own connection.
+	
+	A partition failing to be written doesn't stop the others. Its instances
+	keep their tracked changes, so they can be saved again once whatever
+	went wrong is fixed.
+	
+	Usage:
+		>>> from save_the_change.bulk import parallel_bulk_save
+		>>> 
+		>>> written, failures = parallel_bulk_save(knights, workers=8)
+		>>> for instances, exception in failures:
+		... 	log.error('Failed to save %d knights: %s', len(instances), exception)
+	
+	With ``workers`` of ``1`` the partitions are written one after another on
+	the calling thread's connection instead, which is what you'll want in
+	tests or with an in-memory database.
+	
+	:param instances: iterable of instances decorated
+		with :func:`~save_the_change.decorators.SaveTheChange`.
+	:param workers: number of partitions to write at once.
+	:param partition_size: maximum number of instances per partition.
+	:param using: database alias to write to.
+	:param batch_size: maximum number of instances written per UPDATE.
+	
+	:return: (written, failures), where ``failures`` is a :class:`list`
+		of ``(instances, exception)`` for each partition that failed.
+	:rtype: :class:`tuple`
+	
+	"""
+	
+	saves, groups = _plan_bulk_save(instances)
+	partitions = []
+	models = defaultdict(list)
+	
+	for instance in saves:
+		models[instance.__class__].append(instance)
+	
+	for model, model_saves in models.items():
+		for partition in chunked(model_saves, partition_size):
+			partitions.append((model, None, partition, using, batch_size, workers > 1))
+	
+	for (model, update_fields), group in groups.items():
+		group.sort(key=lambda instance: instance.pk)
+		
+		for partition in chunked(group, partition_size):
+			partitions.append((model, update_fields, partition, using, batch_size, workers > 1))
+	
+	if workers > 1 and len(partitions) > 1:
+		pool = ThreadPool(min(workers, len(partitions)))
+		
+		try:
+			results = pool.map(_save_partition, partitions, chunksize=1)
+		
+		finally:
+			pool.close()
+			pool.join()
+	
+	else:
+		results = [_save_partition(partition[:-1] + (False,)) for partition in partitions]
+	
+	written = sum(len(instances) for instances, exception in results if exception is None)
+	failures = [(instances, exception) for instances, exception in results if exception is not None]
+	
+	return (written, failures)
+
+
+def sync_records(model, records, key='external_id', chunk_size=1000, using=None):
+	"""
+	Reconciles a stream of records against the rows already in the database, \
+	writing only real differences.
+	
+	Records are consumed ``chunk_size`` at a time. For each chunk, the existing
+	rows are loaded with a single query on ``key``, each record's values are
+	assigned onto its matching instance, and only the instances that actually
+	changed are written (see :func:`bulk_save`). Records with no matching row
+	are created with :meth:`~django.db.models.query.QuerySet.bulk_create`.
+	Only one chunk is ever held in memory.
+	
+	Usage:
+		>>> from save_the_change.bulk import sync_records
+		>>> 
+		>>> sync_records(Knight, feed, key='external_id', chunk_size=500)
+		(12, 48)
+	
+	:param model: model decorated
+		with :func:`~save_the_change.decorators.SaveTheChange`.
+	:param records: iterable of :class:`dict` instances mapping field names to
+		values, each including ``key``.
+	:param key: name of the field identifying a record.
+	:param chunk_size: number of records handled per query.
+	:param using: database alias to read from and write to.
+	
+	:return: (created, updated)
+	:rtype: :class:`tuple`
+	
+	"""
+	
+	using = using or router.db_for_write(model)
+	created = updated = 0
+	
+	for chunk in chunked(records, chunk_size):
+		existing = {
+			getattr(instance, key): instance
+			for instance in model._default_manager.using(using).filter(**{'%s__in' % key: [record[key] for record in chunk]})
+		}
+		new = {}
+		
+		for record in chunk:
+			instance = existing.get(record[key])
+			
+			if instance is None:
+				instance = new.get(record[key])
+				
+				if instance is None:
+					new[record[key]] = model(**record)
+					
+					continue
+			
+			for name, value in record.items():
+				setattr(instance, name, value)
+		
+		updated += bulk_save(existing.values(), using=using)
+		
+		if new:
+			model._default_manager.using(using).bulk_create(new.values())
+			created += len(new)
+	
+	return (created, updated)
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.utils import six, timezone
+
+
+#: A :class:`dict` mapping types to the comparators used for values of that
+#: type on every tracked model, unless a field has its own comparator.
+#: Comparators take the old and new values and return :const:`True` if they
+#: should be considered equal.
+COMPARATORS = {}
+
+
+def differs(meta, name, old_value, new_value):
+	"""
+	Checks if a field's value has meaningfully changed.
+	
+	:param meta: the model's :attr:`_meta`.
+	:param name: the name of the field.
+	
+	The field's own comparator (set
+	with :func:`~save_the_change.decorators.Comparators`) is used first, then
+	any registered in :data:`COMPARATORS` for the old value's type, and failing
+	both we fall back to ``!=``.
+	
+	:return:
+		:const:`True` if the values differ, :const:`False` if they're equal.
+	:rtype: :obj:`bool`
+	
+	"""
+	
+	comparators = getattr(meta, '_stc_comparators', None)
+	
+	# Django < 1.10's deferred loading subclasses have a _meta of their own.
+	if comparators is None:
+		comparators = getattr(meta.concrete_model._meta, '_stc_comparators', {})
+	
+	comparator = comparators.get(name) or COMPARATORS.get(type(old_value))
+	
+	if comparator is None:
+		return old_value != new_value
+	
+	return not comparator(old_value, new_value)
+
+
+def approximately(rel_tol=1e-09, abs_tol=0.0):
+	"""
+	Returns a comparator for numbers that are equal within a tolerance, as \
+	with :func:`math.isclose`.
+	
+	"""
+	
+	def approximately(old_value, new_value):
+		try:
+			return abs(old_value - new_value) <= max(rel_tol * max(abs(old_value), abs(new_value)), abs_tol)
+		
+		except TypeError:
+			return old_value == new_value
+	
+	return approximately
+
+
+def same_number(old_value, new_value):
+	"""
+	Compares numbers by their numeric value regardless of type or exponent, \
+	so ``Decimal('1.50')``, ``'1.5'``, and ``1.5`` are all equal.
+	
+	"""
+	
+	try:
+		return Decimal(six.text_type(old_value)) == Decimal(six.text_type(new_value))
+	
+	except (InvalidOperation, ValueError):
+		return old_value == new_value
+
+
+def same_instant(old_value, new_value):
+	"""
+	Compares datetimes as instants, treating naive datetimes as being in the \
+	current time zone.
+	
+	"""
+	
+	if isinstance(old_value, datetime) and isinstance(new_value, datetime):
+		if timezone.is_naive(old_value) != timezone.is_naive(new_value):
+			if timezone.is_naive(old_value):
+				old_value = timezone.make_aware(old_value)
+			
+			else:
+				new_value = timezone.make_aware(new_value)
+	
+	return old_value == new_value
+
+
+def same_json(old_value, new_value):
+	"""
+	Compares values as JSON, decoding any strings first so that differences \
+	in key order or whitespace are ignored.
+	
+	"""
+	
+	try:
+		if isinstance(old_value, six.string_types):
+			old_value = json.loads(old_value)
+		
+		if isinstance(new_value, six.string_types):
+			new_value = json.loads(new_value)
+	
+	except ValueError:
+		pass
+	
+	return old_value == new_value
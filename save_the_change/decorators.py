@@ -2,24 +2,65 @@
 
 from __future__ import division, absolute_import, print_function, unicode_literals
 
+import sys
 from collections import defaultdict
+from itertools import count
+from weakref import WeakSet
 
+from django import VERSION as DJANGO_VERSION
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db import connections, router
+from django.db.models import F, Func, Model, Value
+from django.db.models.base import ModelState
+from django.db.models.functions import Concat
+from django.db.models.signals import class_prepared, post_init, pre_init
 from django.utils import six
 
-from .util import DoesNotExist
+from . import buffering
+from .comparators import differs
+from .util import DoesNotExist, is_mutable
 from .mappings import OldValues
 
-from .descriptors import _inject_descriptors
+from .descriptors import ChangeTrackingDescriptor, _inject_deferred_descriptors, _inject_descriptors
+from .identity import _current_identity_map, _suspended_identity_map
 
 
-__all__ = ('SaveTheChange', 'UpdateTogether', 'TrackChanges')
+__all__ = ('SaveTheChange', 'UpdateTogether', 'TrackChanges', 'Comparators', 'computed_field', 'SaveHook', 'Appendable', 'RowVersion')
+
+
+#: The order :func:`SaveTheChange`'s save hook runs in. Save hooks run in
+#: ascending order, and those with the same order in the order they
+#: were added.
+SAVE_THE_CHANGE_ORDER = 0
+
+#: The order the save hook for :func:`computed_field` runs in.
+COMPUTED_FIELDS_ORDER = 100
+
+#: The order save hooks added with :func:`SaveHook` run in by default.
+DEFAULT_ORDER = 500
+
+#: The order :func:`UpdateTogether`'s save hook runs in, after any others
+#: that may have added to ``update_fields``.
+UPDATE_TOGETHER_ORDER = 1000
+
+#: The order the save hook for buffered counters (see :func:`SaveTheChange`)
+#: runs in, once ``update_fields`` is final.
+BUFFERED_COUNTERS_ORDER = 2000
+
+#: The order :func:`RowVersion`'s save hook runs in, once it's certain the
+#: save will be written.
+ROW_VERSION_ORDER = 3000
 
 
 class STCMixin(object):
 	"""
 	Hooks into :meth:`~django.db.models.Model.__init__`,
-	:meth:`~django.db.models.Model.save`, and
-	:meth:`~django.db.models.Model.refresh_from_db`, and adds some new, private
+	:meth:`~django.db.models.Model.from_db` (for
+	:func:`~save_the_change.identity.identity_map`),
+	:meth:`~django.db.models.Model.save`,
+	:meth:`~django.db.models.Model.refresh_from_db`,
+	:meth:`~django.db.models.Model.full_clean`, and
+	:meth:`~django.db.models.Model.validate_unique`, and adds some new, private
 	attributes to the model:
 	
 	:attr:`_mutable_fields`
@@ -28,43 +69,397 @@ class STCMixin(object):
 	:attr:`_changed_fields`
 		A :class:`dict` storing a copy of immutable fields' original values when
 		they're changed.
+	:attr:`_stc_version`
+		An :class:`int` incremented on every assignment to a tracked field and
+		every reset of the tracked state. Mutable values changed in place
+		don't increment it, as we've no way of knowing they have been.
+	:attr:`_stc_checkpoints`
+		A :class:`~weakref.WeakSet` of the live :class:`Checkpoint` instances
+		taken of the model, if any have been.
 	
 	"""
 	
+	_stc_checkpoints = ()
+	
 	def __init__(self, *args, **kwargs):
 		self._changed_fields = {}
 		self._mutable_fields = {}
 		self._mutability_checked = set()
+		self._stc_version = 0
 		
 		super(STCMixin, self).__init__(*args, **kwargs)
 		
-	def save(self, *args, **kwargs):
-		for save_hook in self._meta._stc_save_hooks:
-			continue_saving, args, kwargs = save_hook(self, *args, **kwargs)
-			
-			if not continue_saving:
-				break
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		identity_map = _current_identity_map()
+		
+		if identity_map is None or cls._meta.pk.attname not in field_names:
+			return cls._stc_from_db(db, field_names, values)
+		
+		# Django < 1.10 loads deferred fields into a subclass of the model.
+		model = cls._meta.proxy_for_model if getattr(cls, '_deferred', False) else cls
+		key = (model, db, values[list(field_names).index(cls._meta.pk.attname)])
+		instance = identity_map.get(key)
+		
+		if instance is None:
+			instance = identity_map[key] = cls._stc_from_db(db, field_names, values)
+		
+		else:
+			for name, value in zip(field_names, values):
+				if name not in instance.__dict__:
+					instance.__dict__[name] = value
+		
+		return instance
+	
+	@classmethod
+	def _stc_from_db(cls, db, field_names, values):
+		"""
+		Builds an instance from a database row.
+		
+		Unless the model overrides :meth:`~django.db.models.Model.__init__`
+		or has fields whose descriptors handle assignment themselves, that's
+		skipped, and the loaded values are written straight into the
+		instance's :attr:`__dict__` rather than assigned one by one through
+		our descriptors, which would only find that there's nothing to track.
+		:data:`~django.db.models.signals.pre_init`
+		and :data:`~django.db.models.signals.post_init` are still sent.
+		
+		Django < 1.10 loads rows (and builds its deferred loading classes)
+		differently enough that we always leave it to
+		:meth:`~django.db.models.Model.from_db` there.
+		
+		"""
+		
+		meta = cls._meta
+		
+		if '_stc_plain_init' not in meta.__dict__:
+			meta._stc_plain_init = DJANGO_VERSION >= (1, 10) and all(
+				'__init__' not in klass.__dict__
+				for klass in cls.__mro__ if klass not in (STCMixin, Model, object)
+			) and not any(
+				hasattr(_django_descriptor(cls, field.attname), '__set__')
+				for field in meta.concrete_fields
+			)
+		
+		if not meta._stc_plain_init:
+			return super(STCMixin, cls).from_db(db, field_names, values)
+		
+		pre_init.send(sender=cls, args=values, kwargs={})
+		
+		new = cls.__new__(cls)
+		new.__dict__.update({
+			'_state': ModelState(),
+			'_changed_fields': {},
+			'_mutable_fields': {},
+			'_mutability_checked': set(),
+			'_stc_version': 0,
+		})
+		
+		if len(values) == len(meta.concrete_fields):
+			new.__dict__.update(zip((field.attname for field in meta.concrete_fields), values))
 		
 		else:
+			new.__dict__.update(zip(field_names, values))
+		
+		new._state.adding = False
+		new._state.db = db
+		
+		post_init.send(sender=cls, instance=new)
+		
+		return new
+	
+	def save(self, *args, **kwargs):
+		continue_saving, args, kwargs = (self._meta._stc_run_save_hooks or _compile_save_hooks(self._meta))(self, args, kwargs)
+		
+		if continue_saving:
 			super(STCMixin, self).save(*args, **kwargs)
 		
-		self._changed_fields = {}
-		self._mutable_fields = {}
-		self._mutability_checked = set()
+		self._reset_stc_state()
+	
+	def _save_table(self, raw=False, cls=None, force_insert=False, force_update=False, using=None, update_fields=None):
+		# Expressions are only swapped in around the write itself, so that
+		# pre_save and post_save receivers still see values.
+		if not raw and (self._meta._stc_buffered or self._meta._stc_appendable or self._meta._stc_row_version):
+			swapped = _swap_in_expressions(self, {'update_fields': update_fields, 'using': using})
+		
+		else:
+			swapped = None
+		
+		try:
+			return super(STCMixin, self)._save_table(raw, cls, force_insert, force_update, using, update_fields)
+		
+		finally:
+			if swapped:
+				self.__dict__.update(swapped)
 	
 	def refresh_from_db(self, using=None, fields=None):
-		super(STCMixin, self).refresh_from_db(using, fields)
+		# Django reloads into a new instance and copies its values over, which
+		# in an identity map would just get us ourselves back.
+		with _suspended_identity_map():
+			super(STCMixin, self).refresh_from_db(using, fields)
+		
+		self._reset_stc_state(fields)
+	
+	def full_clean(self, exclude=None, validate_unique=True, changed_only=False):
+		"""
+		Validates the instance, just
+		as :meth:`~django.db.models.Model.full_clean` does.
+		
+		With ``changed_only``, an instance that's already been saved only has
+		its changed fields cleaned and validated, and only the uniqueness
+		constraints involving at least one of them checked
+		(see :meth:`validate_unique`). :meth:`~django.db.models.Model.clean`
+		is still called.
+		
+		Usage:
+			>>> knight = Knight.objects.get(name='Lancelot')
+			>>> knight.title = 'Sir'
+			>>> knight.full_clean(changed_only=True) # Only validates title.
+		
+		"""
+		
+		if not changed_only or self._state.adding:
+			return super(STCMixin, self).full_clean(exclude, validate_unique)
+		
+		exclude = list(exclude or ())
+		changed = self._stc_changed_names()
+		errors = {}
+		
+		try:
+			super(STCMixin, self).full_clean(
+				exclude + [field.name for field in self._meta.fields if field.name not in changed],
+				validate_unique=False
+			)
+		
+		except ValidationError as e:
+			errors = e.update_error_dict(errors)
+		
+		if validate_unique:
+			try:
+				self.validate_unique(exclude + [name for name in errors if name != NON_FIELD_ERRORS], changed_only=True)
+			
+			except ValidationError as e:
+				errors = e.update_error_dict(errors)
+		
+		if errors:
+			raise ValidationError(errors)
+	
+	def validate_unique(self, exclude=None, changed_only=False):
+		"""
+		Checks the instance's uniqueness constraints, just
+		as :meth:`~django.db.models.Model.validate_unique` does.
+		
+		With ``changed_only``, an instance that's already been saved skips the
+		query for every ``unique``, ``unique_together``,
+		and ``unique_for_<date/month/year>`` constraint that involves none of
+		its changed fields, as nothing it could collide with has changed.
+		
+		"""
+		
+		if not changed_only or self._state.adding:
+			return super(STCMixin, self).validate_unique(exclude)
+		
+		changed = self._stc_changed_names()
+		unique_checks, date_checks = self._get_unique_checks(exclude=exclude)
+		
+		errors = self._perform_unique_checks([
+			(model_class, check) for model_class, check in unique_checks
+			if not changed.isdisjoint(check)
+		])
+		date_errors = self._perform_date_checks([
+			(model_class, lookup_type, name, unique_for) for model_class, lookup_type, name, unique_for in date_checks
+			if name in changed or unique_for in changed
+		])
+		
+		for name, messages in six.iteritems(date_errors):
+			errors.setdefault(name, []).extend(messages)
+		
+		if errors:
+			raise ValidationError(errors)
+	
+	def _stc_changed_names(self):
+		"""
+		Returns the names (rather than attnames) of the instance's changed
+		fields.
+		
+		:rtype: :class:`set`
+		
+		"""
+		
+		changed = set(_changed_field_names(self))
+		
+		return set(field.name for field in self._meta.concrete_fields if field.name in changed or field.attname in changed)
+	
+	def _reset_stc_state(self, fields=None):
+		"""
+		Forgets tracked changes for the given field names, or for all fields if
+		none are given.
+		
+		The tracked state is replaced rather than changed in place, so that
+		any :class:`Checkpoint` holding on to it is left alone, and the
+		original values of the fields being forgotten are handed to those
+		checkpoints that will need them.
+		
+		"""
+		
+		for checkpoint in self._stc_checkpoints:
+			for name, value in six.iteritems(self._changed_fields):
+				if name not in checkpoint.changed_fields and (not fields or name in fields):
+					checkpoint.originals.setdefault(name, value)
 		
 		if fields:
-			for field in fields:
-				self._changed_fields.pop(field, None)
-				self._mutable_fields.pop(field, None)
-				self._mutability_checked.discard(field)
+			fields = set(fields)
+			
+			if not fields.isdisjoint(self._changed_fields):
+				self._changed_fields = {name: value for name, value in six.iteritems(self._changed_fields) if name not in fields}
+			
+			if not fields.isdisjoint(self._mutable_fields):
+				self._mutable_fields = {name: value for name, value in six.iteritems(self._mutable_fields) if name not in fields}
+			
+			if not fields.isdisjoint(self._mutability_checked):
+				self._mutability_checked = self._mutability_checked - fields
 		
 		else:
 			self._changed_fields = {}
 			self._mutable_fields = {}
 			self._mutability_checked = set()
+		
+		self._stc_version += 1
+
+
+class Checkpoint(object):
+	"""
+	A model's tracked state at a point in time, as returned by
+	:meth:`~django.db.models.Model.checkpoint`.
+	
+	Only the changed fields' original and current values are copied. The rest
+	of the tracked state is only ever added to or replaced, never changed in
+	place, so it's simply referenced, and the original values of any fields
+	that are changed and then forgotten (by a save, say) are added
+	to :attr:`originals` as they're forgotten.
+	
+	"""
+	
+	__slots__ = (
+		'changed_fields', 'values', 'mutated', 'mutable_fields',
+		'mutability_checked', 'originals', 'adding', 'db', '__weakref__'
+	)
+	
+	def __init__(self, instance):
+		self.changed_fields = dict(instance._changed_fields)
+		self.values = {
+			name: _snapshot(instance, name, instance.__dict__[name])
+			for name in self.changed_fields if name in instance.__dict__
+		}
+		self.mutated = {
+			name: _snapshot(instance, name, instance.__dict__[name])
+			for name, value in six.iteritems(instance._mutable_fields)
+			if name in instance.__dict__ and differs(instance._meta, name, value, instance.__dict__[name])
+		}
+		self.mutable_fields = instance._mutable_fields
+		self.mutability_checked = instance._mutability_checked
+		self.originals = {}
+		self.adding = instance._state.adding
+		self.db = instance._state.db
+	
+	def value(self, instance, name):
+		"""
+		Returns the value the given field had when the checkpoint was taken,
+		or :class:`~save_the_change.util.DoesNotExist` if it's not changed
+		since.
+		
+		"""
+		
+		for values in (self.values, self.mutated, self.originals, self.mutable_fields, instance._changed_fields, instance._mutable_fields):
+			if name in values:
+				return values[name]
+		
+		return DoesNotExist
+
+
+def _django_descriptor(cls, name):
+	"""
+	Returns the descriptor Django has for the named attribute (unwrapped from \
+	our own), if any.
+	
+	"""
+	
+	descriptor = next((klass.__dict__[name] for klass in cls.__mro__ if name in klass.__dict__), None)
+	
+	if isinstance(descriptor, ChangeTrackingDescriptor):
+		return descriptor.django_descriptor
+	
+	return descriptor
+
+
+def _snapshot(instance, name, value):
+	"""
+	Copies a field's value with its descriptor, if it's mutable.
+	
+	"""
+	
+	if not is_mutable(value):
+		return value
+	
+	return next(klass.__dict__[name] for klass in type(instance).__mro__ if name in klass.__dict__).snapshot(value)
+
+
+def _run_save_hooks(instance, *args, **kwargs):
+	"""
+	Runs the model's save hooks in order, stopping early if any of them asks \
+	for the save to be skipped.
+	
+	:return: (continue_saving, args, kwargs)
+	:rtype: :class:`tuple`
+	
+	"""
+	
+	return (instance._meta._stc_run_save_hooks or _compile_save_hooks(instance._meta))(instance, args, kwargs)
+
+
+def _compile_save_hooks(meta):
+	"""
+	Compiles a model's save hooks into a single function that runs them all, \
+	with the loop over them unrolled and each hook bound as a global.
+	
+	The function is compiled when the model is first saved, and again after
+	any save hooks are added.
+	
+	:return: The compiled function, taking ``(instance, args, kwargs)`` and
+		returning ``(continue_saving, args, kwargs)``.
+	:rtype: :obj:`function`
+	
+	"""
+	
+	namespace = {}
+	lines = ['def run_save_hooks(instance, args, kwargs):']
+	
+	for index, save_hook in enumerate(meta._stc_save_hooks):
+		namespace['save_hook_%d' % index] = save_hook
+		lines.extend((
+			'\tcontinue_saving, args, kwargs = save_hook_%d(instance, *args, **kwargs)' % index,
+			'\tif not continue_saving:',
+			'\t\treturn (False, args, kwargs)',
+		))
+	
+	lines.append('\treturn (True, args, kwargs)')
+	
+	six.exec_('\n'.join(lines), namespace)
+	meta._stc_run_save_hooks = namespace['run_save_hooks']
+	
+	return meta._stc_run_save_hooks
+
+
+def _add_save_hook(cls, save_hook, order=DEFAULT_ORDER):
+	"""
+	Adds a save hook to a model, unless it already has it.
+	
+	"""
+	
+	if save_hook not in cls._meta._stc_save_hooks:
+		cls._meta._stc_save_hook_orders = sorted(cls._meta._stc_save_hook_orders + [(order, save_hook)], key=lambda entry: entry[0])
+		cls._meta._stc_save_hooks = [save_hook for order, save_hook in cls._meta._stc_save_hook_orders]
+		cls._meta._stc_run_save_hooks = None
 
 
 def _inject_stc(cls):
@@ -79,17 +474,132 @@ def _inject_stc(cls):
 		:const:`True` if we've already wrapped fields on this model.
 	:attr:`_stc_save_hooks`
 		A :class:`list` of hooks to run
-		during :meth:`~django.db.models.Model.save`.
+		during :meth:`~django.db.models.Model.save`, in order.
+	:attr:`_stc_save_hook_orders`
+		A :class:`list` of ``(order, save_hook)`` for each save hook, which
+		:attr:`_stc_save_hooks` is built from.
+	:attr:`_stc_run_save_hooks`
+		The function compiled from :attr:`_stc_save_hooks`
+		by :func:`_compile_save_hooks`, or :const:`None` if it's yet to be.
+	:attr:`_stc_comparators`
+		A :class:`dict` of field names to the comparators used to decide if
+		they've changed.
+	:attr:`_stc_attnames`
+		A :class:`dict` of ForeignKey names to their attnames, which is how
+		they're tracked.
+	:attr:`_stc_computed_fields`
+		A :class:`list` of ``(name, depends_on, method)`` for each of the
+		model's methods decorated with :func:`computed_field`, in the order
+		they were defined.
+	:attr:`_stc_pk_attnames`
+		A :class:`set` of the attnames of the model's primary key and those of
+		any models it inherits from.
+	:attr:`_stc_buffered`
+		A :class:`frozenset` of the attnames of fields buffered as counters.
+	:attr:`_stc_appendable`
+		A :class:`frozenset` of the attnames of fields marked
+		with :func:`Appendable`.
+	:attr:`_stc_row_version`
+		The attname of the field set with :func:`RowVersion`,
+		or :const:`None`.
+	:attr:`_stc_plain_init`
+		:const:`True` if the model doesn't override
+		:meth:`~django.db.models.Model.__init__`, set when it's first loaded
+		from the database.
+	
+	Models inheriting from an already decorated model start out with a copy of
+	its save hooks, comparators, and :func:`UpdateTogether` groups.
 	
 	"""
 	
 	if not hasattr(cls._meta, '_stc_injected'):
 		_inject_descriptors(cls)
 		
-		cls.__bases__ = (STCMixin,) + cls.__bases__
+		parent_meta = next((klass._meta for klass in cls.__mro__[1:] if hasattr(getattr(klass, '_meta', None), '_stc_injected')), None)
+		
+		if not issubclass(cls, STCMixin):
+			cls.__bases__ = (STCMixin,) + cls.__bases__
 		
 		cls._meta._stc_injected = True
-		cls._meta._stc_save_hooks = []
+		cls._meta._stc_save_hook_orders = list(getattr(parent_meta, '_stc_save_hook_orders', []))
+		cls._meta._stc_save_hooks = [save_hook for order, save_hook in cls._meta._stc_save_hook_orders]
+		cls._meta._stc_run_save_hooks = None
+		cls._meta._stc_comparators = dict(getattr(parent_meta, '_stc_comparators', {}))
+		cls._meta._stc_attnames = {
+			field.name: field.attname for field in cls._meta.concrete_fields
+			if field.name != field.attname
+		}
+		cls._meta._stc_pk_attnames = set(meta.pk.attname for meta in [cls._meta] + [parent._meta for parent in cls._meta.get_parent_list()] if meta.pk)
+		cls._meta._stc_computed_fields = []
+		cls._meta._stc_buffered = getattr(parent_meta, '_stc_buffered', frozenset())
+		cls._meta._stc_appendable = getattr(parent_meta, '_stc_appendable', frozenset())
+		cls._meta._stc_row_version = getattr(parent_meta, '_stc_row_version', None)
+		
+		if hasattr(parent_meta, 'update_together_groups'):
+			cls._meta.update_together_groups = list(parent_meta.update_together_groups)
+			cls._meta.update_together = None
+		
+		# Walk the MRO backwards so that methods overridden in subclasses win.
+		computed_fields = {}
+		
+		for klass in reversed(cls.__mro__):
+			for value in klass.__dict__.values():
+				if getattr(value, '_stc_computed_field', None):
+					computed_fields[value._stc_computed_field[0]] = value._stc_computed_field
+		
+		for name, depends_on, method, creation_counter in sorted(six.itervalues(computed_fields), key=lambda computed_field: computed_field[3]):
+			depends_on = set(depends_on) | set(cls._meta._stc_attnames.get(field, field) for field in depends_on)
+			cls._meta._stc_computed_fields.append((name, depends_on, method))
+		
+		if cls._meta._stc_computed_fields:
+			_add_save_hook(cls, _computed_fields_save_hook, COMPUTED_FIELDS_ORDER)
+
+
+def _inject_stc_into_subclass(sender, **kwargs):
+	"""
+	Makes sure models inheriting from decorated models are themselves \
+	decorated, whether or not they're decorated explicitly.
+	
+	Django < 1.10's deferred loading classes aren't decorated, as wrapping
+	their :class:`~django.db.models.query_utils.DeferredAttribute` instances
+	would break loading deferred fields. As they do get a :attr:`_meta` of
+	their own, they share their model's tracking attributes instead, and
+	their deferred attributes are swapped for ones that hand off to our
+	descriptors (see :func:`~save_the_change.descriptors._inject_deferred_descriptors`).
+	
+	"""
+	
+	if getattr(sender, '_deferred', False):
+		meta = sender._meta.proxy_for_model._meta
+		
+		if hasattr(meta, '_stc_injected'):
+			for name, value in six.iteritems(meta.__dict__):
+				if name.startswith('_stc_'):
+					setattr(sender._meta, name, value)
+			
+			_inject_deferred_descriptors(sender)
+	
+	elif not hasattr(sender._meta, '_stc_injected') and any(
+		hasattr(getattr(klass, '_meta', None), '_stc_injected') for klass in sender.__mro__[1:]
+	):
+		_inject_stc(sender)
+
+
+class_prepared.connect(_inject_stc_into_subclass)
+
+
+def _changed_field_names(instance):
+	"""
+	Lists the names of all of an instance's changed fields.
+	
+	:rtype: :class:`list`
+	
+	"""
+	
+	return (
+		[name for name, value in six.iteritems(instance._changed_fields)] +
+		[name for name, value in six.iteritems(instance._mutable_fields) if hasattr(instance, name) and differs(instance._meta, name, value, getattr(instance, name))]
+	)
 
 
 def _save_the_change_save_hook(instance, *args, **kwargs):
@@ -114,36 +624,87 @@ def _save_the_change_save_hook(instance, *args, **kwargs):
 		hasattr(instance, '_mutable_fields') and
 		'update_fields' not in kwargs and
 		not kwargs.get('force_insert', False) and
-		instance._meta.pk.attname not in instance._changed_fields
+		not instance._meta._stc_pk_attnames.intersection(instance._changed_fields)
 	):
-		kwargs['update_fields'] = (
-			[name for name, value in six.iteritems(instance._changed_fields)] +
-			[name for name, value in six.iteritems(instance._mutable_fields) if hasattr(instance, name) and getattr(instance, name) != value]
-		)
+		kwargs['update_fields'] = _changed_field_names(instance)
 		
 		return (bool(kwargs['update_fields']), args, kwargs)
 	
 	return (True, args, kwargs)
 
 
-def SaveTheChange(cls):
+def SaveTheChange(cls=None, buffered=()):
 	"""
 	Decorator that wraps models with a save hook to save only what's changed.
 	
+	It can also be called with the names of integer fields to be treated as
+	counters. Saves that change nothing but those fields aren't written, but
+	add their changes to :data:`~save_the_change.buffering.BUFFER` to be
+	written later as increments, along with any others to the same rows.
+	
+	Usage:
+		>>> from django.db import models
+		>>> from save_the_change.decorators import SaveTheChange
+		>>> 
+		>>> @SaveTheChange(buffered=('view_count',))
+		>>> class Knight(models.model):
+		>>> 	...
+	
 	"""
 	
-	if not hasattr(cls._meta, '_stc_injected') or _save_the_change_save_hook not in cls._meta._stc_save_hooks:
+	def SaveTheChange(cls):
 		_inject_stc(cls)
 		
-		# We need to ensure that if SaveTheChange and UpdateTogether are both
-		# used, that UpdateTogether's save hook will always run second.
-		if _update_together_save_hook in cls._meta._stc_save_hooks:
-			cls._meta._stc_save_hooks = [_save_the_change_save_hook, _update_together_save_hook]
+		# SaveTheChange's save hook runs first, so that any other hooks (such
+		# as UpdateTogether's) see the update_fields it sets.
+		_add_save_hook(cls, _save_the_change_save_hook, SAVE_THE_CHANGE_ORDER)
 		
-		else:
-			cls._meta._stc_save_hooks.append(_save_the_change_save_hook)
+		if buffered:
+			cls._meta._stc_buffered = cls._meta._stc_buffered | frozenset(cls._meta.get_field(name).attname for name in buffered)
+			_add_save_hook(cls, _buffered_counters_save_hook, BUFFERED_COUNTERS_ORDER)
+		
+		return cls
 	
-	return cls
+	if cls is None:
+		return SaveTheChange
+	
+	return SaveTheChange(cls)
+
+
+def _buffered_counters_save_hook(instance, *args, **kwargs):
+	"""
+	Skips saves that only change buffered counters, adding the changes
+	to :data:`~save_the_change.buffering.BUFFER` instead.
+	
+	:return: (continue_saving, args, kwargs)
+	:rtype: :class:`tuple`
+	
+	"""
+	
+	update_fields = kwargs.get('update_fields')
+	
+	if not update_fields or instance._state.adding or not instance._meta._stc_buffered.issuperset(update_fields):
+		return (True, args, kwargs)
+	
+	deltas = {}
+	
+	for name in update_fields:
+		old_value = instance._changed_fields.get(name)
+		new_value = instance.__dict__.get(name)
+		
+		if old_value is None or new_value is None:
+			return (True, args, kwargs)
+		
+		deltas[name] = new_value - old_value
+	
+	buffering.BUFFER.add(
+		instance.__class__,
+		kwargs.get('using') or router.db_for_write(instance.__class__, instance=instance),
+		instance.pk,
+		deltas
+	)
+	
+	return (False, args, kwargs)
 
 
 def TrackChanges(cls):
@@ -156,33 +717,57 @@ def TrackChanges(cls):
 		known database representation.
 	:attr:`~django.db.models.Model.changed_fields`
 		A :class:`set` of the names of all changed fields on the model.
+	:attr:`~django.db.models.Model.state_version`
+		An :class:`int` that changes whenever the model's fields are assigned
+		to, or it's saved, reloaded, or rolled back. It doesn't change when a
+		mutable value is changed in place, so only values derived from
+		immutable fields can be memoized against it.
 	:attr:`~django.db.models.Model.old_values`
 		The model's fields in their last known database representation as a
 		read-only mapping (:class:`~save_the_change.mappings.OldValues`).
 	:meth:`~django.db.models.Model._meta.revert_fields`
 		Reverts the given fields back to their last known
 		database representation.
+	:meth:`~django.db.models.Model.checkpoint`
+		Returns a :class:`Checkpoint` of the model's fields and tracked state.
+	:meth:`~django.db.models.Model.rollback_to`
+		Restores the model's fields and tracked state to a
+		given :class:`Checkpoint`.
+	
+	Neither :attr:`~django.db.models.Model.has_changed`
+	nor :attr:`~django.db.models.Model.changed_fields` is memoized. Changed
+	immutable fields are already known without comparing anything, but mutable
+	values can be changed in place through any reference to them without us
+	knowing, so those that have been read are compared with their originals
+	on every access, and there's nothing about that which could be cached.
 	
 	"""
 	
 	_inject_stc(cls)
 	
-	def has_changed(self):
+	def _mutated_fields(self):
+		# Mutable values are read straight from __dict__, as there's no need
+		# to track their being read here.
 		return (
-			bool(self._changed_fields) or
-			any(getattr(self, name) != value for name, value in six.iteritems(self._mutable_fields))
+			name for name, value in six.iteritems(self._mutable_fields)
+			if differs(self._meta, name, value, self.__dict__.get(name, DoesNotExist))
 		)
 	
+	def has_changed(self):
+		return bool(self._changed_fields) or any(True for name in _mutated_fields(self))
+	
 	cls.has_changed = property(has_changed)
 	
 	def changed_fields(self):
-		return (
-			set(name for name in six.iterkeys(self._changed_fields)) |
-			set(name for name, value in six.iteritems(self._mutable_fields) if getattr(self, name, DoesNotExist) != value)
-		)
+		return set(self._changed_fields).union(_mutated_fields(self))
 	
 	cls.changed_fields = property(changed_fields)
 	
+	def state_version(self):
+		return self._stc_version
+	
+	cls.state_version = property(state_version)
+	
 	def old_values(self):
 		return OldValues(self)
 	
@@ -204,12 +789,63 @@ def TrackChanges(cls):
 		if isinstance(names, (six.text_type, six.binary_type) + six.string_types):
 			names = [names]
 		
-		for name in names:
+		for name in (self._meta._stc_attnames.get(name, name) for name in names):
 			if name in self.changed_fields:
 				setattr(self, name, self.old_values[name])
 	
 	cls.revert_fields = revert_fields
 	
+	def checkpoint(self):
+		"""
+		Returns a :class:`Checkpoint` of the model's tracked state, which can
+		later be restored with :meth:`rollback_to`.
+		
+		Its cost scales with the number of changed fields, not the number of
+		fields on the model.
+		
+		"""
+		
+		checkpoint = Checkpoint(self)
+		
+		if not self._stc_checkpoints:
+			self._stc_checkpoints = WeakSet()
+		
+		self._stc_checkpoints.add(checkpoint)
+		
+		return checkpoint
+	
+	cls.checkpoint = checkpoint
+	
+	def rollback_to(self, checkpoint):
+		"""
+		Restores the fields' values and the tracked state to what they were
+		when ``checkpoint`` was taken, without touching the database.
+		
+		:param checkpoint: a :class:`Checkpoint` returned
+			by :meth:`checkpoint`.
+		
+		"""
+		
+		names = set(self._changed_fields)
+		
+		for values in (checkpoint.values, checkpoint.mutated, checkpoint.originals, checkpoint.mutable_fields, self._mutable_fields):
+			names.update(values)
+		
+		for name in names:
+			value = checkpoint.value(self, name)
+			
+			if value is not DoesNotExist and name in self.__dict__ and differs(self._meta, name, self.__dict__[name], value):
+				setattr(self, name, _snapshot(self, name, value))
+		
+		self._changed_fields = dict(checkpoint.changed_fields)
+		self._mutable_fields = checkpoint.mutable_fields
+		self._mutability_checked = checkpoint.mutability_checked
+		self._state.adding = checkpoint.adding
+		self._state.db = checkpoint.db
+		self._stc_version += 1
+	
+	cls.rollback_to = rollback_to
+	
 	return cls
 
 
@@ -225,16 +861,83 @@ def _update_together_save_hook(instance, *args, **kwargs):
 	"""
 	
 	if 'update_fields' in kwargs:
-		new_update_fields = set(kwargs['update_fields'])
-		
-		for field in kwargs['update_fields']:
-			new_update_fields.update(instance._meta.update_together.get(field, []))
-		
-		kwargs['update_fields'] = list(new_update_fields)
+		kwargs['update_fields'] = _expand_update_together(instance._meta, kwargs['update_fields'])
 	
 	return(True, args, kwargs)
 
 
+def _expand_update_together(meta, update_fields):
+	"""
+	Adds to ``update_fields`` any fields that have been marked as needing to be \
+	updated together with them.
+	
+	:return: The expanded ``update_fields``.
+	:rtype: :class:`list`
+	
+	"""
+	
+	new_update_fields = set(update_fields)
+	
+	for field in update_fields:
+		new_update_fields.update(_update_together(meta).get(field, []))
+	
+	return list(new_update_fields)
+
+
+def _update_together(meta):
+	"""
+	Returns a model's :attr:`update_together`, a mapping of each field in any
+	of its :func:`UpdateTogether` groups to the set of all fields it must be
+	updated with, building it on first use.
+	
+	:param meta: the model's :attr:`_meta`.
+	
+	:rtype: :class:`dict`
+	
+	"""
+	
+	if getattr(meta, 'update_together', None) is not None:
+		return meta.update_together
+	
+	if not hasattr(meta, 'update_together_groups'):
+		return {}
+	
+	update_together = defaultdict(set)
+	field_names = {field.name for field in meta.fields if field.concrete}
+	
+	# Fields may be referenced in multiple groups, so we'll walk the graph once
+	# for all of them.
+	neighbors = defaultdict(set)
+	seen_nodes = set()
+	
+	for group in (
+		{field for field in group if field in field_names}
+		for group in meta.update_together_groups
+	):
+		for node in group:
+			neighbors[node].update(group)
+	
+	for node in neighbors:
+		sqaushed_group = set()
+		
+		if node not in seen_nodes:
+			nodes = set([node])
+			
+			while nodes:
+				node = nodes.pop()
+				seen_nodes.add(node)
+				nodes |= neighbors[node] - seen_nodes
+				sqaushed_group.add(node)
+			
+			for grouped_node in sqaushed_group:
+				update_together[grouped_node] = sqaushed_group
+				update_together[meta._stc_attnames.get(grouped_node, grouped_node)] = sqaushed_group
+	
+	meta.update_together = update_together
+	
+	return update_together
+
+
 def UpdateTogether(*groups):
 	"""
 	Decorator for specifying groups of fields to be updated together.
@@ -256,43 +959,369 @@ def UpdateTogether(*groups):
 	def UpdateTogether(cls, groups=groups):
 		_inject_stc(cls)
 		
+		# The groups are only squashed together by _update_together when
+		# they're first needed, so stacking this decorator costs nothing.
 		cls._meta.update_together_groups = getattr(cls._meta, 'update_together_groups', []) + list(groups)
-		cls._meta.update_together = defaultdict(set)
-		field_names = {field.name for field in cls._meta.fields if field.concrete}
-		
-		# Fields may be referenced in multiple groups, so we'll walk the
-		# graph when the model's class is built. If this decorator is used
-		# multiple times things will still work, but we'll end up doing this
-		# walk multiple times as well. It's only at startup, though, so not
-		# a big deal.
-		neighbors = defaultdict(set)
-		seen_nodes = set()
-		
-		for group in (
-			{field for field in group if field in field_names}
-			for group in cls._meta.update_together_groups
+		cls._meta.update_together = None
+		
+		_add_save_hook(cls, _update_together_save_hook, UPDATE_TOGETHER_ORDER)
+		
+		return cls
+	
+	return UpdateTogether
+
+
+def SaveHook(save_hook, order=DEFAULT_ORDER):
+	"""
+	Decorator for adding a save hook to a model.
+	
+	Save hooks are called with the instance being saved and the arguments
+	to :meth:`~django.db.models.Model.save`, and return a :class:`tuple` of
+	``(continue_saving, args, kwargs)``. If ``continue_saving`` is
+	:const:`False` the save is skipped, otherwise the (possibly altered)
+	arguments are passed on to the next hook, and finally
+	to :meth:`~django.db.models.Model.save` itself.
+	
+	Usage:
+		>>> from django.db import models
+		>>> from save_the_change.decorators import SaveTheChange, SaveHook
+		>>> 
+		>>> def touch_editor(instance, *args, **kwargs):
+		... 	if 'update_fields' in kwargs:
+		... 		kwargs['update_fields'] = list(kwargs['update_fields']) + ['editor']
+		... 	
+		... 	return (True, args, kwargs)
+		>>> 
+		>>> @SaveTheChange
+		>>> @SaveHook(touch_editor, order=200)
+		>>> class Knight(models.model):
+		>>> 	...
+	
+	:param save_hook: the save hook to add.
+	:param order: when to run the hook relative to others;
+		see :data:`DEFAULT_ORDER`.
+	
+	"""
+	
+	def SaveHook(cls):
+		_inject_stc(cls)
+		_add_save_hook(cls, save_hook, order)
+		
+		return cls
+	
+	return SaveHook
+
+
+def Comparators(**comparators):
+	"""
+	Decorator for specifying how to decide if fields have changed.
+	
+	Each comparator takes a field's old and new values and
+	returns :const:`True` if they should be considered equal, in which case
+	assigning the new value won't mark the field as changed. Comparators for
+	whole types can be registered
+	in :data:`~save_the_change.comparators.COMPARATORS`.
+	
+	Usage:
+		>>> from django.db import models
+		>>> from save_the_change.comparators import approximately, same_instant
+		>>> from save_the_change.decorators import SaveTheChange, Comparators
+		>>> 
+		>>> @SaveTheChange
+		>>> @Comparators(
+		... 	height=approximately(abs_tol=0.01),
+		... 	knighted=same_instant,
+		... )
+		>>> class Knight(models.model):
+		>>> 	...
+	
+	"""
+	
+	def Comparators(cls, comparators=comparators):
+		_inject_stc(cls)
+		
+		for name, comparator in six.iteritems(comparators):
+			field = cls._meta.get_field(name)
+			
+			cls._meta._stc_comparators[field.name] = comparator
+			cls._meta._stc_comparators[field.attname] = comparator
+		
+		return cls
+	
+	return Comparators
+
+
+def Appendable(*names):
+	"""
+	Decorator for marking fields that mostly change by having something \
+	appended to them.
+	
+	When a text field's new value is its old value with something added to
+	the end, only what was added is sent, with the column set to the
+	concatenation of its current value and the addition. On PostgreSQL, array
+	fields that have only gained trailing elements are likewise sent just
+	their new elements. Any other change is saved as normal.
+	
+	Usage:
+		>>> from django.db import models
+		>>> from save_the_change.decorators import SaveTheChange, Appendable
+		>>> 
+		>>> @SaveTheChange
+		>>> @Appendable('chronicle')
+		>>> class Knight(models.model):
+		>>> 	...
+	
+	The appended fields only hold the expressions being written rather than
+	their values while the UPDATE itself is sent, so
+	:data:`~django.db.models.signals.pre_save`
+	and :data:`~django.db.models.signals.post_save` receivers see values.
+	
+	"""
+	
+	def Appendable(cls, names=names):
+		_inject_stc(cls)
+		
+		cls._meta._stc_appendable = cls._meta._stc_appendable | frozenset(cls._meta.get_field(name).attname for name in names)
+		
+		return cls
+	
+	return Appendable
+
+
+def _swap_in_expressions(instance, kwargs):
+	"""
+	Replaces the values of fields about to be saved with expressions that \
+	compute them from what's in the column: buffered counters with the \
+	column plus their change, :func:`Appendable` fields that have only been \
+	appended to with the column plus the addition, and the :func:`RowVersion` \
+	field with the column plus one.
+	
+	Buffered counters are written as increments, rather than as their values,
+	because increments from earlier saves of the row may still be waiting
+	in :data:`~save_the_change.buffering.BUFFER`, and would otherwise be
+	counted twice when it's flushed.
+	
+	The replaced fields are marked as having had their mutability checked, so
+	reading an expression while it's swapped in isn't mistaken for a change.
+	
+	:return: The replaced values, to be put back once the instance is saved.
+	:rtype: :class:`dict`
+	
+	"""
+	
+	replaced = {}
+	meta = instance._meta
+	update_fields = kwargs.get('update_fields')
+	
+	if meta._stc_row_version and update_fields and meta._stc_row_version in update_fields:
+		replaced[meta._stc_row_version] = instance.__dict__[meta._stc_row_version]
+		instance.__dict__[meta._stc_row_version] = F(meta.get_field(meta._stc_row_version).name) + 1
+		instance.__dict__['_mutability_checked'].add(meta._stc_row_version)
+	
+	for name in meta._stc_buffered.intersection(update_fields or ()):
+		old_value = instance._changed_fields.get(name)
+		new_value = instance.__dict__.get(name)
+		
+		if old_value is None or new_value is None or hasattr(new_value, 'resolve_expression'):
+			continue
+		
+		replaced[name] = new_value
+		instance.__dict__[name] = F(meta.get_field(name).name) + (new_value - old_value)
+		instance.__dict__['_mutability_checked'].add(name)
+	
+	for name in meta._stc_appendable.intersection(update_fields or ()):
+		old_value = instance._changed_fields.get(name, instance._mutable_fields.get(name))
+		new_value = instance.__dict__.get(name)
+		
+		if (
+			not old_value or type(old_value) is not type(new_value) or
+			not isinstance(new_value, six.string_types + (list,)) or len(new_value) <= len(old_value)
 		):
-			for node in group:
-				neighbors[node].update(group)
+			continue
 		
-		for node in neighbors:
-			sqaushed_group = set()
+		field = meta.get_field(name)
+		
+		if isinstance(new_value, six.string_types) and new_value.startswith(old_value):
+			replaced[name] = new_value
+			instance.__dict__[name] = Concat(F(field.name), Value(new_value[len(old_value):]), output_field=field)
+			instance.__dict__['_mutability_checked'].add(name)
+		
+		elif (
+			isinstance(new_value, list) and new_value[:len(old_value)] == old_value and
+			connections[kwargs.get('using') or router.db_for_write(instance.__class__, instance=instance)].vendor == 'postgresql'
+		):
+			replaced[name] = new_value
+			instance.__dict__[name] = Func(F(field.name), Value(new_value[len(old_value):], output_field=field), function='array_cat', output_field=field)
+	
+	return replaced
+
+
+def RowVersion(name):
+	"""
+	Decorator for adding a row version to a model.
+	
+	``name`` is an integer field incremented in the database on every save,
+	which lets :meth:`~django.db.models.Model.refresh_if_stale` check whether
+	the row has changed since it was loaded by fetching just that field.
+	Saves that are skipped because nothing's changed, and those buffered
+	by ``SaveTheChange(buffered=(...))``, don't increment it.
+	
+	Usage:
+		>>> from django.db import models
+		>>> from save_the_change.decorators import SaveTheChange, RowVersion
+		>>> 
+		>>> @SaveTheChange
+		>>> @RowVersion('version')
+		>>> class Knight(models.model):
+		>>> 	...
+		>>> 	version = models.IntegerField(default=0)
+		>>> 
+		>>> knight.refresh_if_stale()
+		False
+	
+	"""
+	
+	def RowVersion(cls, name=name):
+		_inject_stc(cls)
+		
+		cls._meta._stc_row_version = cls._meta.get_field(name).attname
+		_add_save_hook(cls, _row_version_save_hook, ROW_VERSION_ORDER)
+		
+		def refresh_if_stale(self, using=None, fields=None):
+			"""
+			Reloads the model from the database, as
+			with :meth:`~django.db.models.Model.refresh_from_db`, but only if
+			its row version has changed.
 			
-			if node not in seen_nodes:
-				nodes = set([node])
-				
-				while nodes:
-					node = nodes.pop()
-					seen_nodes.add(node)
-					nodes |= neighbors[node] - seen_nodes
-					sqaushed_group.add(node)
-				
-				for grouped_node in sqaushed_group:
-					cls._meta.update_together[grouped_node] = sqaushed_group
+			Reloading only some ``fields`` leaves the row version as it was,
+			as the rest of the model is still as stale as it was.
+			
+			:return: :const:`True` if the model was reloaded.
+			:rtype: :obj:`bool`
+			
+			"""
+			
+			name = self._meta._stc_row_version
+			using = using or self._state.db
+			version = self.__class__._base_manager.using(using).filter(pk=self.pk).values_list(name, flat=True).get()
+			
+			if version == self.__dict__.get(name):
+				return False
+			
+			self.refresh_from_db(using=using, fields=fields)
+			
+			return True
 		
-		if not hasattr(cls._meta, '_stc_injected') or _update_together_save_hook not in cls._meta._stc_save_hooks:
-			cls._meta._stc_save_hooks.append(_update_together_save_hook)
+		cls.refresh_if_stale = refresh_if_stale
 		
 		return cls
 	
-	return UpdateTogether
+	return RowVersion
+
+
+def _row_version_save_hook(instance, *args, **kwargs):
+	"""
+	Increments the model's :func:`RowVersion` field, and adds it
+	to ``update_fields`` if that's set.
+	
+	:return: (continue_saving, args, kwargs)
+	:rtype: :class:`tuple`
+	
+	"""
+	
+	name = instance._meta._stc_row_version
+	
+	if kwargs.get('update_fields') is not None and not kwargs['update_fields']:
+		return (True, args, kwargs)
+	
+	instance.__dict__[name] = (instance.__dict__.get(name) or 0) + 1
+	
+	if kwargs.get('update_fields') is not None and name not in kwargs['update_fields']:
+		kwargs['update_fields'] = list(kwargs['update_fields']) + [name]
+	
+	return (True, args, kwargs)
+
+
+_computed_field_counter = count()
+
+
+def computed_field(name, depends_on):
+	"""
+	Decorator for model methods that compute the value of a derived field.
+	
+	Whenever the model is saved with any of the fields in ``depends_on``
+	changed (or is saved for the first time), the method is called and its
+	result assigned to the field ``name``, which is then added
+	to ``update_fields`` if it's changed. Computed fields may depend on other
+	computed fields defined before them.
+	
+	The model must be decorated with at least one of the other decorators in
+	this module for the method to be picked up.
+	
+	Usage:
+		>>> from django.db import models
+		>>> from django.utils.text import slugify
+		>>> from save_the_change.decorators import SaveTheChange, computed_field
+		>>> 
+		>>> @SaveTheChange
+		>>> class Knight(models.model):
+		>>> 	...
+		>>> 	
+		>>> 	@computed_field('slug', depends_on=('name',))
+		>>> 	def compute_slug(self):
+		>>> 		return slugify(self.name)
+	
+	"""
+	
+	def computed_field(method, name=name, depends_on=depends_on):
+		method._stc_computed_field = (name, tuple(depends_on), method, next(_computed_field_counter))
+		
+		return method
+	
+	return computed_field
+
+
+def _computed_fields_save_hook(instance, *args, **kwargs):
+	"""
+	Recomputes any fields decorated with :func:`computed_field` whose inputs \
+	have changed, adding them to ``update_fields`` if it's set.
+	
+	:return: (continue_saving, args, kwargs)
+	:rtype: :class:`tuple`
+	
+	"""
+	
+	if 'update_fields' in kwargs:
+		changed_fields = set(kwargs['update_fields'])
+	
+	elif not instance._state.adding:
+		changed_fields = set(_changed_field_names(instance))
+	
+	else:
+		changed_fields = None
+	
+	update_fields = list(kwargs.get('update_fields', ()))
+	
+	for name, depends_on, method in instance._meta._stc_computed_fields:
+		if changed_fields is None or changed_fields & depends_on:
+			value = method(instance)
+			
+			if differs(instance._meta, name, getattr(instance, name), value):
+				setattr(instance, name, value)
+				
+				if changed_fields is not None:
+					changed_fields.add(name)
+				
+				if name not in update_fields:
+					update_fields.append(name)
+	
+	if 'update_fields' in kwargs:
+		kwargs['update_fields'] = update_fields
+	
+	return (True, args, kwargs)
+
+
+if sys.version_info >= (3, 5):
+	from .asynchronous import asave
+	
+	STCMixin.asave = asave
@@ -4,7 +4,13 @@ from __future__ import division, absolute_import, print_function, unicode_litera
 
 from copy import deepcopy
 
-from .util import DoesNotExist, is_mutable
+from django.db import connections
+from django.db.models import ForeignKey
+from django.db.models.fields.files import FieldFile, FileField
+from django.db.models.query_utils import DeferredAttribute
+
+from .comparators import differs
+from .util import DoesNotExist, chunked, is_mutable
 
 
 class ChangeTrackingDescriptor(object):
@@ -26,6 +32,9 @@ class ChangeTrackingDescriptor(object):
 			return self.django_descriptor
 		
 		if self.django_descriptor:
+			if self.name not in instance.__dict__ and '_stc_siblings' in instance.__dict__:
+				_load_deferred_for_siblings(instance, self.name)
+			
 			value = self.django_descriptor.__get__(instance, owner)
 		
 		else:
@@ -41,24 +50,35 @@ class ChangeTrackingDescriptor(object):
 			self.name in instance.__dict__['_mutable_fields']
 		):
 			if is_mutable(value):
-				instance.__dict__['_mutable_fields'][self.name] = deepcopy(value)
+				instance.__dict__['_mutable_fields'][self.name] = self.snapshot(value)
 			
 			instance.__dict__['_mutability_checked'].add(self.name)
 		
 		return value
 	
 	def __set__(self, instance, value):
+		instance.__dict__['_stc_version'] += 1
+		
 		if self.name not in instance.__dict__['_mutable_fields']:
 			old_value = instance.__dict__.get(self.name, DoesNotExist)
 			
-			if old_value is DoesNotExist and self.django_descriptor and hasattr(self.django_descriptor, 'cache_name'):
-				old_value = instance.__dict__.get(self.django_descriptor.cache_name, DoesNotExist)
-			
 			if old_value is not DoesNotExist:
-				if instance.__dict__['_changed_fields'].get(self.name, DoesNotExist) == value:
+				original_value = instance.__dict__['_changed_fields'].get(self.name, old_value)
+				
+				if not differs(instance._meta, self.name, original_value, value):
 					instance.__dict__['_changed_fields'].pop(self.name, None)
+					
+					# A comparator's found the values equal without them
+					# being so. From here on we compare against the original
+					# lazily, as we do for mutable values, so that a run of
+					# changes each too small to notice can't add up to one
+					# that's silently never saved. (We can't just test the
+					# values for equality: on Python 2 comparing, say, a naive
+					# and an aware datetime raises.)
+					if value is not original_value:
+						instance.__dict__['_mutable_fields'][self.name] = original_value
 				
-				elif value != old_value:
+				else:
 					# Unfortunately we need to make a deep copy here, which is
 					# a bit more expensive than a shallow copy. This is to
 					# avoid situations like:
@@ -79,13 +99,131 @@ class ChangeTrackingDescriptor(object):
 					# without likely worse solutions (such as checking *all*
 					# attributes for immutability on model
 					# instantiation/refresh).
-					instance.__dict__['_changed_fields'].setdefault(self.name, deepcopy(old_value))
+					instance.__dict__['_changed_fields'].setdefault(self.name, self.snapshot(old_value))
 		
 		if self.django_descriptor and hasattr(self.django_descriptor, '__set__'):
 			self.django_descriptor.__set__(instance, value)
 		
 		else:
 			instance.__dict__[self.name] = value
+	
+	def snapshot(self, value):
+		"""
+		Returns a copy of ``value`` that won't be affected by any later changes
+		to it.
+		
+		"""
+		
+		return deepcopy(value)
+
+
+class FileTrackingDescriptor(ChangeTrackingDescriptor):
+	"""
+	Descriptor that wraps :class:`~django.db.models.FileField` attributes to \
+	detect changes.
+	
+	A :class:`~django.db.models.fields.files.FieldFile` is only ever changed
+	by changing its name, so we snapshot it as a fresh
+	:class:`~django.db.models.fields.files.FieldFile` sharing the same storage
+	rather than deep copying its storage and any open file along with it.
+	
+	"""
+	
+	def snapshot(self, value):
+		if isinstance(value, FieldFile):
+			return value.__class__(value.instance, value.field, value.name)
+		
+		return super(FileTrackingDescriptor, self).snapshot(value)
+
+
+class ForeignKeyTrackingDescriptor(ChangeTrackingDescriptor):
+	"""
+	Descriptor that wraps :class:`~django.db.models.ForeignKey` attnames to \
+	detect changes.
+	
+	ForeignKeys are tracked only by the value of their ``_id`` attname, so
+	tracking them never has to load or copy the related instance. When that
+	value changes, any related instance Django has cached that no longer
+	matches it is dropped, just as if it had been assigned through the
+	ForeignKey itself.
+	
+	"""
+	
+	def __init__(self, name, django_descriptor=None, field=None):
+		super(ForeignKeyTrackingDescriptor, self).__init__(name, django_descriptor)
+		
+		self.field = field
+		self.cache_name = field.get_cache_name()
+	
+	def __set__(self, instance, value):
+		super(ForeignKeyTrackingDescriptor, self).__set__(instance, value)
+		
+		related = instance.__dict__.get(self.cache_name, DoesNotExist)
+		
+		# The related model may not have been resolved when we were created, so
+		# we can only look up the field we point to now.
+		if related is not DoesNotExist and getattr(related, self.field.foreign_related_fields[0].attname, None) != value:
+			del(instance.__dict__[self.cache_name])
+
+
+class DeferredTrackingAttribute(DeferredAttribute):
+	"""
+	Stands in for a :class:`~django.db.models.query_utils.DeferredAttribute` \
+	on Django < 1.10's deferred loading classes.
+	
+	Those shadow the model's own descriptors, so once the deferred value's
+	been loaded (along with its siblings', if it has any) this hands off to
+	the model's :class:`ChangeTrackingDescriptor`, as it does for all
+	assignments.
+	
+	"""
+	
+	def __init__(self, field_name, model, descriptor):
+		super(DeferredTrackingAttribute, self).__init__(field_name, model)
+		
+		self.descriptor = descriptor
+	
+	def __get__(self, instance, owner):
+		if instance is None:
+			return self
+		
+		if self.field_name not in instance.__dict__:
+			if '_stc_siblings' in instance.__dict__:
+				_load_deferred_for_siblings(instance, self.field_name)
+			
+			if self.field_name not in instance.__dict__:
+				super(DeferredTrackingAttribute, self).__get__(instance, owner)
+		
+		return self.descriptor.__get__(instance, owner)
+	
+	def __set__(self, instance, value):
+		self.descriptor.__set__(instance, value)
+
+
+def _load_deferred_for_siblings(instance, name):
+	"""
+	Loads a deferred field for an instance and all of its siblings (those \
+	loaded by the same :class:`~save_the_change.querysets.TrackedQuerySet`) \
+	that are also missing it, with as few queries as possible.
+	
+	The loaded values are the instances' last known database representation,
+	so they aren't counted as changes.
+	
+	"""
+	
+	db = instance._state.db
+	siblings = [
+		sibling for sibling in instance.__dict__['_stc_siblings']
+		if name not in sibling.__dict__ and sibling._state.db == db and sibling.__class__ is instance.__class__
+	]
+	
+	for batch in chunked(siblings, connections[db].ops.bulk_batch_size(['pk'], siblings) or len(siblings)):
+		values = dict(instance.__class__._base_manager.using(db).filter(pk__in=[sibling.pk for sibling in batch]).values_list('pk', name))
+		
+		for sibling in batch:
+			if sibling.pk in values:
+				sibling.__dict__[name] = values[sibling.pk]
+				sibling._reset_stc_state([name])
 
 
 def _inject_descriptors(cls):
@@ -93,10 +231,42 @@ def _inject_descriptors(cls):
 	Iterates over concrete fields in a model and wraps them in a descriptor to \
 	track their changes.
 	
+	Fields inherited through multi-table inheritance have their descriptors on
+	the parent class, so we look for Django's descriptor along the MRO, and
+	leave the field alone if a parent's already tracking it.
+	
 	"""
 	
 	for field in cls._meta.concrete_fields:
-		setattr(cls, field.attname, ChangeTrackingDescriptor(field.attname, cls.__dict__.get(field.attname)))
+		django_descriptor = next((klass.__dict__[field.attname] for klass in cls.__mro__ if field.attname in klass.__dict__), None)
+		
+		if isinstance(django_descriptor, ChangeTrackingDescriptor):
+			continue
+		
+		if isinstance(field, ForeignKey):
+			setattr(cls, field.attname, ForeignKeyTrackingDescriptor(field.attname, django_descriptor, field))
+		
+		elif isinstance(field, FileField):
+			setattr(cls, field.attname, FileTrackingDescriptor(field.attname, django_descriptor))
 		
-		if field.attname != field.name:
-			setattr(cls, field.name, ChangeTrackingDescriptor(field.name, cls.__dict__.get(field.name)))
+		else:
+			setattr(cls, field.attname, ChangeTrackingDescriptor(field.attname, django_descriptor))
+
+
+def _inject_deferred_descriptors(cls):
+	"""
+	Replaces the :class:`~django.db.models.query_utils.DeferredAttribute` \
+	instances on one of Django < 1.10's deferred loading classes with
+	:class:`DeferredTrackingAttribute` instances.
+	
+	"""
+	
+	for name, value in list(cls.__dict__.items()):
+		if type(value) is DeferredAttribute:
+			descriptor = next(
+				(klass.__dict__[name] for klass in cls.__mro__[1:] if isinstance(klass.__dict__.get(name), ChangeTrackingDescriptor)),
+				None
+			)
+			
+			if descriptor is not None:
+				setattr(cls, name, DeferredTrackingAttribute(name, cls, descriptor))
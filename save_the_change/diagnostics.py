@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import sys
+from collections import Counter
+from copy import deepcopy
+
+from django.db.models.signals import post_init, post_save, pre_save
+from django.test.runner import DiscoverRunner
+
+from .util import is_mutable
+
+
+__all__ = ('WastedWrites', 'DiagnosticRunner')
+
+
+class WastedWrites(object):
+	"""
+	Finds where :func:`~save_the_change.decorators.SaveTheChange` would pay \
+	off most, by counting the columns written by full-row saves of models \
+	that aren't decorated and how many of them actually changed.
+	
+	Usage:
+		>>> from save_the_change.diagnostics import WastedWrites
+		>>> 
+		>>> with WastedWrites() as wasted_writes:
+		... 	run_nightly_import()
+		>>> 
+		>>> print(wasted_writes.format_report())
+		Model                 Saves  Written  Changed   Wasted
+		roundtable.Knight       120     2400      130     2270
+	
+	Every instance of every model is snapshotted as it's created while
+	collecting, so this is meant for test runs and one off investigations
+	rather than production.
+	
+	"""
+	
+	def __init__(self):
+		self.saves = Counter()
+		self.written = Counter()
+		self.changed = Counter()
+	
+	def start(self):
+		"""
+		Starts collecting.
+		
+		"""
+		
+		post_init.connect(self._snapshot, dispatch_uid=('stc_wasted_writes', id(self)), weak=False)
+		post_save.connect(self._snapshot, dispatch_uid=('stc_wasted_writes', id(self)), weak=False)
+		pre_save.connect(self._count, dispatch_uid=('stc_wasted_writes', id(self)), weak=False)
+	
+	def stop(self):
+		"""
+		Stops collecting.
+		
+		"""
+		
+		post_init.disconnect(dispatch_uid=('stc_wasted_writes', id(self)))
+		post_save.disconnect(dispatch_uid=('stc_wasted_writes', id(self)))
+		pre_save.disconnect(dispatch_uid=('stc_wasted_writes', id(self)))
+	
+	def __enter__(self):
+		self.start()
+		
+		return self
+	
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.stop()
+	
+	def _snapshot(self, sender, instance, **kwargs):
+		if not hasattr(sender._meta, '_stc_injected'):
+			instance.__dict__['_stc_loaded_values'] = {
+				field.attname: deepcopy(instance.__dict__[field.attname]) if is_mutable(instance.__dict__[field.attname]) else instance.__dict__[field.attname]
+				for field in sender._meta.concrete_fields if field.attname in instance.__dict__
+			}
+	
+	def _count(self, sender, instance, raw=False, update_fields=None, **kwargs):
+		loaded_values = instance.__dict__.get('_stc_loaded_values')
+		
+		if raw or update_fields is not None or instance._state.adding or loaded_values is None:
+			return
+		
+		fields = [field for field in sender._meta.concrete_fields if not field.primary_key]
+		
+		self.saves[sender] += 1
+		self.written[sender] += len(fields)
+		self.changed[sender] += sum(
+			1 for field in fields
+			if getattr(field, 'auto_now', False) or loaded_values.get(field.attname) != instance.__dict__.get(field.attname)
+		)
+	
+	def report(self):
+		"""
+		Summarizes what's been collected, most wasted column writes first.
+		
+		:return: (model, saves, written, changed, wasted) for each model.
+		:rtype: :class:`list` of :class:`tuple`
+		
+		"""
+		
+		return sorted((
+			(model, self.saves[model], self.written[model], self.changed[model], self.written[model] - self.changed[model])
+			for model in self.saves
+		), key=lambda row: (-row[4], _label(row[0])))
+	
+	def format_report(self, limit=20):
+		"""
+		Formats the first ``limit`` rows of :meth:`report` as a table.
+		
+		:rtype: :obj:`str`
+		
+		"""
+		
+		lines = ['%-20s %6s %8s %8s %8s' % ('Model', 'Saves', 'Written', 'Changed', 'Wasted')]
+		
+		for model, saves, written, changed, wasted in self.report()[:limit]:
+			lines.append('%-20s %6d %8d %8d %8d' % (_label(model), saves, written, changed, wasted))
+		
+		return '\n'.join(lines)
+
+
+def _label(model):
+	"""
+	Returns a model's ``app_label.ObjectName`` (as :attr:`_meta.label` does \
+	from Django 1.9 on).
+	
+	"""
+	
+	return '%s.%s' % (model._meta.app_label, model._meta.object_name)
+
+
+class DiagnosticRunner(DiscoverRunner):
+	"""
+	Test runner that collects :class:`WastedWrites` over the whole test run \
+	and prints the report when it's done.
+	
+	Usage:
+		>>> TEST_RUNNER = 'save_the_change.diagnostics.DiagnosticRunner'
+	
+	"""
+	
+	def run_tests(self, *args, **kwargs):
+		with WastedWrites() as wasted_writes:
+			result = super(DiagnosticRunner, self).run_tests(*args, **kwargs)
+		
+		print('\n' + wasted_writes.format_report(), file=sys.stderr)
+		
+		return result
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import FileField, ForeignKey
+from django.forms.models import InlineForeignKeyField, construct_instance
+from django.utils import six
+
+from .comparators import differs
+from .decorators import STCMixin
+from .util import DoesNotExist
+
+
+__all__ = ('TrackedModelFormMixin',)
+
+
+class TrackedModelFormMixin(object):
+	"""
+	:class:`~django.forms.ModelForm` mixin that only assigns the fields the \
+	form has changed to its instance.
+	
+	A plain :class:`~django.forms.ModelForm` assigns every one of its fields
+	to its instance, each of which a tracked model has to compare and possibly
+	copy. This instead assigns only the fields whose cleaned values differ
+	from the instance's, so the work done scales with the number of fields
+	edited rather than the width of the form. Likewise, an instance
+	that's already been saved only has its changed fields validated, and only
+	their uniqueness checked (see :meth:`~save_the_change.decorators.STCMixin.full_clean`).
+	
+	Usage:
+		>>> from django import forms
+		>>> from save_the_change.forms import TrackedModelFormMixin
+		>>> 
+		>>> class KnightForm(TrackedModelFormMixin, forms.ModelForm):
+		... 	class Meta:
+		... 		model = Knight
+		... 		fields = '__all__'
+	
+	"""
+	
+	def _post_clean(self):
+		if not isinstance(self.instance, STCMixin):
+			return super(TrackedModelFormMixin, self)._post_clean()
+		
+		# This mirrors ModelForm._post_clean, save for the instance
+		# being constructed from only the changed fields.
+		opts = self._meta
+		exclude = self._get_validation_exclusions()
+		
+		for name, field in self.fields.items():
+			if isinstance(field, InlineForeignKeyField):
+				exclude.append(name)
+		
+		try:
+			self.instance = construct_changed_instance(self, self.instance, opts.fields, opts.exclude)
+		
+		except ValidationError as e:
+			self._update_errors(e)
+		
+		try:
+			self.instance.full_clean(exclude=exclude, validate_unique=False, changed_only=True)
+		
+		except ValidationError as e:
+			self._update_errors(e)
+		
+		if self._validate_unique:
+			self.validate_unique()
+	
+	def validate_unique(self):
+		if not isinstance(self.instance, STCMixin):
+			return super(TrackedModelFormMixin, self).validate_unique()
+		
+		try:
+			self.instance.validate_unique(exclude=self._get_validation_exclusions(), changed_only=True)
+		
+		except ValidationError as e:
+			self._update_errors(e)
+
+
+def construct_changed_instance(form, instance, fields=None, exclude=None):
+	"""
+	Assigns the fields from a bound ``form``'s ``cleaned_data`` that differ \
+	from the instance's values to it, as \
+	:func:`~django.forms.models.construct_instance` does for every field.
+	
+	Values are compared with the instance's rather than the form's
+	:attr:`~django.forms.Form.initial` data, which needn't be the same.
+	
+	:return: The instance.
+	
+	"""
+	
+	cleaned_data = form.cleaned_data
+	form.cleaned_data = {
+		name: value for name, value in six.iteritems(cleaned_data)
+		if _differs_from_instance(instance, name, value)
+	}
+	
+	try:
+		return construct_instance(form, instance, fields, exclude)
+	
+	finally:
+		form.cleaned_data = cleaned_data
+
+
+def _differs_from_instance(instance, name, value):
+	"""
+	Checks if assigning a cleaned form value to the named field would change \
+	the instance.
+	
+	Related instances are compared by primary key, so as not to load the
+	instance's, and files are always assigned, as
+	:meth:`~django.db.models.FileField.save_form_data` decides what to do
+	with them. The instance's values are read from its :attr:`__dict__`
+	(unless they're deferred), as reading them through our descriptors would
+	have them copied and tracked.
+	
+	:rtype: :obj:`bool`
+	
+	"""
+	
+	try:
+		field = instance._meta.get_field(name)
+	
+	except FieldDoesNotExist:
+		return True
+	
+	if isinstance(field, FileField) or not field.concrete:
+		return True
+	
+	if isinstance(field, ForeignKey):
+		value = getattr(value, field.foreign_related_fields[0].attname, None)
+	
+	current_value = instance.__dict__.get(field.attname, DoesNotExist)
+	
+	if current_value is DoesNotExist:
+		current_value = getattr(instance, field.attname)
+	
+	return differs(instance._meta, field.attname, current_value, value)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+from contextlib import contextmanager
+from threading import local
+
+
+__all__ = ('identity_map', 'IdentityMapMiddleware')
+
+
+_local = local()
+
+
+@contextmanager
+def identity_map():
+	"""
+	Makes sure each row is only ever loaded into one instance of a tracked \
+	model within the block.
+	
+	Loading a row that's already been loaded hands back the instance it was
+	first loaded into, along with any changes pending on it, rather than a new
+	instance. Fields that instance didn't yet have (because they were
+	deferred) are filled in from the new load, but fields it did have are left
+	alone. Fetching an already loaded instance by primary key
+	with :meth:`~save_the_change.querysets.TrackedQuerySet.get` doesn't even
+	query the database.
+	
+	Usage:
+		>>> from save_the_change.identity import identity_map
+		>>> 
+		>>> with identity_map():
+		... 	knight = Knight.objects.get(pk=1)
+		... 	knight.title = 'King'
+		... 	Knight.objects.filter(order='Round Table')[0].title
+		'King'
+	
+	Instances are held for as long as the block lasts. Nested blocks share
+	the outermost block's map. Instances deleted in bulk
+	with :meth:`~django.db.models.query.QuerySet.delete` aren't noticed, so
+	fetching one of them again by primary key will still find it.
+	
+	:return: The map, a :class:`dict` of ``(model, db, pk)`` to instances.
+	:rtype: :class:`dict`
+	
+	"""
+	
+	if getattr(_local, 'identity_map', None) is not None:
+		yield _local.identity_map
+		
+		return
+	
+	_local.identity_map = {}
+	
+	try:
+		yield _local.identity_map
+	
+	finally:
+		_local.identity_map = None
+
+
+def _current_identity_map():
+	"""
+	Returns the identity map for the current thread, or :const:`None` if \
+	there isn't one.
+	
+	"""
+	
+	return getattr(_local, 'identity_map', None)
+
+
+@contextmanager
+def _suspended_identity_map():
+	"""
+	Suspends the current thread's identity map (if any) within the block, so \
+	that rows are loaded into new instances.
+	
+	"""
+	
+	identity_map = getattr(_local, 'identity_map', None)
+	_local.identity_map = None
+	
+	try:
+		yield
+	
+	finally:
+		_local.identity_map = identity_map
+
+
+class IdentityMapMiddleware(object):
+	"""
+	Middleware that wraps each request in an :func:`identity_map`.
+	
+	Usage:
+		>>> MIDDLEWARE = [
+		... 	...
+		... 	'save_the_change.identity.IdentityMapMiddleware',
+		... ]
+	
+	"""
+	
+	def __init__(self, get_response=None):
+		self.get_response = get_response
+	
+	def __call__(self, request):
+		with identity_map():
+			return self.get_response(request)
@@ -11,6 +11,8 @@ class OldValues(Mapping):
 	its model.
 	
 	Attributes can be accessed with either dot or bracket notation.
+	ForeignKeys are keyed by their attname (``enlightenment_id``, not
+	``enlightenment``).
 	
 	"""
 	
@@ -33,6 +35,12 @@ class OldValues(Mapping):
 				return self.instance._changed_fields[name]
 			
 			except KeyError:
+				# ForeignKeys are only tracked by their attname, so if that's
+				# changed we can't give back the old related instance without
+				# fetching it.
+				if self.instance._meta._stc_attnames.get(name, name) in self.instance._changed_fields:
+					raise KeyError(name)
+				
 				try:
 					return getattr(self.instance, name)
 				
@@ -41,10 +49,7 @@ class OldValues(Mapping):
 	
 	def __iter__(self):
 		for field in self.instance._meta.get_fields():
-			yield field.name
-			
-			if field.name != field.attname:
-				yield field.attname
+			yield self.instance._meta._stc_attnames.get(field.name, field.name)
 	
 	def __len__(self):
 		return len(self.instance._meta.get_fields())
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.utils import six
+
+from .bulk import bulk_save
+from .decorators import STCMixin, _changed_field_names, _update_together
+from .identity import _current_identity_map
+from .records import TrackedRecord
+from .util import Siblings
+
+
+__all__ = ('TrackedQuerySet',)
+
+
+class TrackedQuerySet(models.QuerySet):
+	"""
+	A :class:`~django.db.models.query.QuerySet` with some extra methods for \
+	working with tracked models in bulk.
+	
+	Usage:
+		>>> from django.db import models
+		>>> from save_the_change.decorators import SaveTheChange
+		>>> from save_the_change.querysets import TrackedQuerySet
+		>>> 
+		>>> @SaveTheChange
+		>>> class Knight(models.model):
+		>>> 	...
+		>>> 	objects = TrackedQuerySet.as_manager()
+	
+	Instances loaded with deferred fields (through
+	:meth:`~django.db.models.query.QuerySet.only`
+	or :meth:`~django.db.models.query.QuerySet.defer`) remember which
+	instances they were loaded with, and reading a deferred field on one of
+	them loads it for all of them with a single query.
+	
+	"""
+	
+	def _fetch_all(self):
+		fetched = self._result_cache is None
+		
+		super(TrackedQuerySet, self)._fetch_all()
+		
+		if fetched and self.query.deferred_loading[0] and issubclass(self.model, STCMixin):
+			siblings = Siblings(instance for instance in self._result_cache if isinstance(instance, STCMixin))
+			
+			for instance in siblings:
+				instance.__dict__['_stc_siblings'] = siblings
+	
+	def get(self, *args, **kwargs):
+		"""
+		Returns the object matching the given lookups, just
+		as :meth:`~django.db.models.query.QuerySet.get` does.
+		
+		Within an :func:`~save_the_change.identity.identity_map`, a lookup of
+		just the primary key on an otherwise unfiltered queryset returns the
+		already loaded instance, if there is one, without a query.
+		
+		"""
+		
+		identity_map = _current_identity_map()
+		
+		if identity_map and not args and len(kwargs) == 1 and not (
+			self.query.where or self.query.select_related or self.query.select_for_update or
+			self.query.annotations or self.query.extra
+		):
+			name, pk = next(six.iteritems(kwargs))
+			meta = self.model._meta
+			
+			if name in ('pk', 'pk__exact', meta.pk.name, meta.pk.attname):
+				try:
+					pk = meta.pk.to_python(pk)
+				
+				except ValidationError:
+					pass
+				
+				else:
+					instance = identity_map.get((self.model, self.db, pk))
+					
+					if instance is not None and instance.pk == pk:
+						return instance
+		
+		return super(TrackedQuerySet, self).get(*args, **kwargs)
+	
+	def update_or_create(self, defaults=None, **kwargs):
+		"""
+		Looks up an object with the given kwargs, updating it with
+		``defaults`` if it exists, otherwise creates a new one, just
+		as :meth:`~django.db.models.query.QuerySet.update_or_create` does.
+		
+		The difference is that an existing object is only written if
+		``defaults`` actually changed it, and then only the changed fields are.
+		
+		:return: (object, created)
+		:rtype: :class:`tuple`
+		
+		"""
+		
+		if not issubclass(self.model, STCMixin):
+			return super(TrackedQuerySet, self).update_or_create(defaults, **kwargs)
+		
+		defaults = defaults or {}
+		lookup, params = self._extract_model_params(defaults, **kwargs)
+		self._for_write = True
+		
+		try:
+			obj = self.get(**lookup)
+		
+		except self.model.DoesNotExist:
+			obj, created = self._create_object_from_params(lookup, params)
+			
+			if created:
+				return (obj, created)
+		
+		for name, value in six.iteritems(defaults):
+			setattr(obj, name, value)
+		
+		update_fields = _changed_field_names(obj)
+		
+		if obj._meta._stc_pk_attnames.intersection(update_fields):
+			obj.save(using=self.db)
+		
+		elif update_fields:
+			obj.save(using=self.db, update_fields=update_fields)
+		
+		return (obj, False)
+	
+	def tracked_records(self, *fields):
+		"""
+		Yields a :class:`~save_the_change.records.TrackedRecord` for each row
+		instead of a model instance.
+		
+		The primary key is always loaded, as is every field that
+		is :func:`~save_the_change.decorators.UpdateTogether` with one of
+		``fields``. If no fields are given, all concrete fields are loaded.
+		
+		"""
+		
+		meta = self.model._meta
+		
+		if fields:
+			names = set(meta.get_field(name).name for name in fields)
+			
+			for name in list(names):
+				names.update(_update_together(meta).get(name, ()))
+			
+			attnames = [meta.pk.attname] + [
+				field.attname for field in meta.concrete_fields
+				if field.name in names and not field.primary_key
+			]
+		
+		else:
+			attnames = [meta.pk.attname] + [field.attname for field in meta.concrete_fields if not field.primary_key]
+		
+		record_class = TrackedRecord.for_model(self.model, attnames)
+		
+		for row in self.values_list(*attnames).iterator():
+			yield record_class(row)
+	
+	def tracked_iterator(self, chunk_size=1000, flush_every=None):
+		"""
+		Yields the queryset's instances a chunk at a time, saving whatever's
+		been changed on them as it goes.
+		
+		Rows are loaded ``chunk_size`` at a time in primary key order, each
+		chunk with its own query picking up after the last primary key of the
+		one before. Once ``flush_every`` instances (by default ``chunk_size``)
+		have been yielded, those that have changed are written
+		with :func:`~save_the_change.bulk.bulk_save` (one UPDATE per set of
+		changed fields) and the rest are let go of, so only a chunk or so is
+		ever held in memory.
+		
+		Usage:
+			>>> for knight in Knight.objects.filter(title='').tracked_iterator(chunk_size=500):
+			... 	knight.title = 'Sir'
+		
+		Changes are written when the instance after the last one of a batch is
+		asked for, so the loop's body must be done with an instance before
+		moving on to the next. Stopping early (with a ``break``, or an
+		exception) leaves the changes made since the last write unsaved.
+		
+		Loading into an :func:`~save_the_change.identity.identity_map` keeps
+		every instance around regardless.
+		
+		As the chunks have to be in primary key order, a queryset with an
+		explicit ordering (from :meth:`~django.db.models.query.QuerySet.order_by`)
+		raises a :exc:`TypeError` rather than having it silently ignored. The
+		model's default ordering is simply replaced.
+		
+		:param chunk_size: number of rows loaded per query.
+		:param flush_every: number of instances yielded per write.
+		
+		"""
+		
+		assert self.query.can_filter(), "Cannot use tracked_iterator() once a slice has been taken."
+		
+		if self.query.order_by or self.query.extra_order_by:
+			raise TypeError("Cannot use tracked_iterator() on an ordered queryset, as it always loads in primary key order.")
+		
+		flush_every = flush_every or chunk_size
+		queryset = self.order_by('pk')
+		chunk = list(queryset[:chunk_size])
+		pending = []
+		
+		while chunk:
+			for instance in chunk:
+				if len(pending) >= flush_every:
+					bulk_save(pending, using=self._db)
+					pending = []
+				
+				yield instance
+				pending.append(instance)
+			
+			if len(chunk) < chunk_size:
+				break
+			
+			last_pk = chunk[-1].pk
+			chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+		
+		bulk_save(pending, using=self._db)
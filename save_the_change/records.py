@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+from collections import defaultdict
+
+from django.db import router, transaction
+from django.utils import six
+
+from .bulk import _update_group
+from .decorators import _expand_update_together
+from .util import chunked
+
+
+__all__ = ('TrackedRecord', 'save_records')
+
+
+class RecordField(object):
+	"""
+	Descriptor for a single column of a :class:`TrackedRecord`.
+	
+	Assignments flip the column's bit in the record's changed bitmask
+	depending on whether the new value differs from the one loaded from
+	the database.
+	
+	"""
+	
+	__slots__ = ('index', 'bit')
+	
+	def __init__(self, index):
+		self.index = index
+		self.bit = 1 << index
+	
+	def __get__(self, instance=None, owner=None):
+		if instance is None:
+			return self
+		
+		return instance._values[self.index]
+	
+	def __set__(self, instance, value):
+		if instance._values is instance._row:
+			instance._values = list(instance._row)
+		
+		instance._values[self.index] = value
+		
+		if value != instance._row[self.index]:
+			instance._changed |= self.bit
+		
+		else:
+			instance._changed &= ~self.bit
+
+
+class TrackedRecord(object):
+	"""
+	A compact, change tracked stand-in for a model instance.
+	
+	Records hold the row they were loaded from as a :class:`tuple` and only
+	copy it when first assigned to, with changes tracked as a bitmask over
+	their columns rather than with per instance dictionaries. They're
+	meant for batch jobs that read and write many rows, and are saved in bulk
+	with :func:`save_records`.
+	
+	Subclasses are built per model and set of columns
+	by :meth:`for_model`.
+	
+	"""
+	
+	__slots__ = ('_row', '_values', '_changed')
+	
+	#: The model the record's rows belong to.
+	_model = None
+	
+	#: The attnames of the record's columns, in row order.
+	_fields = ()
+	
+	_classes = {}
+	
+	def __init__(self, row):
+		self._row = self._values = row
+		self._changed = 0
+	
+	@classmethod
+	def for_model(cls, model, fields):
+		"""
+		Returns the (cached) record class for the given model and field
+		attnames, the first of which must be the primary key's.
+		
+		"""
+		
+		key = (model, tuple(fields))
+		
+		if key not in cls._classes:
+			attrs = {
+				'__slots__': (),
+				'_model': model,
+				'_fields': key[1],
+			}
+			
+			for index, name in enumerate(key[1]):
+				attrs[str(name)] = RecordField(index)
+			
+			cls._classes[key] = type(str('%sRecord' % model.__name__), (cls,), attrs)
+		
+		return cls._classes[key]
+	
+	@property
+	def pk(self):
+		return self._values[0]
+	
+	@property
+	def has_changed(self):
+		return bool(self._changed)
+	
+	@property
+	def changed_fields(self):
+		return set(name for index, name in enumerate(self._fields) if self._changed & (1 << index))
+	
+	def _reset_stc_state(self):
+		self._row = self._values = tuple(self._values)
+		self._changed = 0
+	
+	def __repr__(self):
+		return str('<%s: %s>' % (self.__class__.__name__, self.pk))
+
+
+def save_records(records, using=None, batch_size=None):
+	"""
+	Saves many tracked records at once, writing only what's changed.
+	
+	Records that have changed the same columns are written together with one
+	UPDATE per ``batch_size`` records, with ``update_fields`` extended by any
+	:func:`~save_the_change.decorators.UpdateTogether` groups just as
+	:meth:`~django.db.models.Model.save` would. Values are written as is,
+	without calling :meth:`~django.db.models.Field.pre_save`, though
+	a :func:`~save_the_change.decorators.RowVersion` field is still
+	incremented.
+	
+	:param records: iterable of :class:`TrackedRecord` instances.
+	:param using: database alias to write to.
+	:param batch_size: maximum number of records written per UPDATE.
+	
+	:return: The number of records written.
+	:rtype: :class:`int`
+	
+	"""
+	
+	groups = defaultdict(list)
+	written = 0
+	
+	for record in records:
+		if record._changed:
+			groups[(record.__class__, record._changed)].append(record)
+	
+	for (record_class, changed), group in six.iteritems(groups):
+		model = record_class._model
+		db = using or router.db_for_write(model)
+		names = {field.attname: field.name for field in model._meta.concrete_fields}
+		update_fields = _expand_update_together(model._meta, [names[attname] for attname in group[0].changed_fields])
+		row_version = getattr(model._meta, '_stc_row_version', None)
+		
+		if row_version and row_version not in update_fields:
+			update_fields = list(update_fields) + [row_version]
+		
+		with transaction.atomic(using=db, savepoint=False):
+			for batch in chunked(group, batch_size or len(group)):
+				_update_group(model, batch, update_fields, db, raw=True)
+		
+		for record in group:
+			# The row version's incremented in the database, so we follow
+			# suit if we've loaded it.
+			if row_version in record._fields:
+				index = record._fields.index(row_version)
+				record._values[index] = (record._values[index] or 0) + 1
+			
+			record._reset_stc_state()
+		
+		written += len(group)
+	
+	return written
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.signals import pre_save
+from django.test.utils import CaptureQueriesContext
+
+
+__all__ = ('SaveAssertionsMixin',)
+
+
+# Django 1.8's SQLite backend logs statements as "QUERY = u'...' - PARAMS = ...".
+_UPDATE = re.compile(r"^(?:QUERY = u?['\"])?UPDATE ")
+
+
+def _columns_written(connection, sql):
+	"""
+	Counts the columns set by an UPDATE statement, or returns ``0`` for any \
+	other statement.
+	
+	"""
+	
+	if not _UPDATE.match(sql):
+		return 0
+	
+	start = sql.find(' SET ')
+	end = sql.rfind(' WHERE ')
+	opening, closing = connection.ops.quote_name('column').split('column')
+	column = '%s[^%s]+%s' % (re.escape(opening), re.escape(closing), re.escape(closing))
+	
+	return len(re.findall(r'(?:^|[\s,])%s = ' % column, sql[start:end if end > start else len(sql)]))
+
+
+class _AssertNumColumnsWrittenContext(CaptureQueriesContext):
+	def __init__(self, test_case, num, connection):
+		self.test_case = test_case
+		self.num = num
+		
+		super(_AssertNumColumnsWrittenContext, self).__init__(connection)
+	
+	def __exit__(self, exc_type, exc_value, traceback):
+		super(_AssertNumColumnsWrittenContext, self).__exit__(exc_type, exc_value, traceback)
+		
+		if exc_type is not None:
+			return
+		
+		updates = [query['sql'] for query in self.captured_queries if _UPDATE.match(query['sql'])]
+		written = sum(_columns_written(self.connection, sql) for sql in updates)
+		
+		self.test_case.assertEqual(
+			written, self.num,
+			'%d columns written, %d expected\nCaptured updates were:\n%s' % (written, self.num, '\n'.join(updates))
+		)
+
+
+class SaveAssertionsMixin(object):
+	"""
+	:class:`~django.test.TestCase` mixin with assertions for what saves write.
+	
+	Usage:
+		>>> from django.test import TestCase
+		>>> from save_the_change.testing import SaveAssertionsMixin
+		>>> 
+		>>> class KnightTestCase(SaveAssertionsMixin, TestCase):
+		... 	def test_knighting(self):
+		... 		knight = Knight.objects.get(name='Arthur')
+		... 		knight.title = 'King'
+		... 		
+		... 		self.assertSavesFields(knight, {'title'})
+		... 		self.assertNoSave(knight)
+		... 		
+		... 		with self.assertNumColumnsWritten(1):
+		... 			knight.title = 'Once and Future King'
+		... 			knight.save()
+	
+	"""
+	
+	def _save_capturing_update_fields(self, instance, **kwargs):
+		"""
+		Saves ``instance``, returning a :class:`list` of the ``update_fields``
+		it was actually saved with, which is empty if the save was skipped.
+		
+		"""
+		
+		saves = []
+		
+		def capture(sender, instance=None, update_fields=None, **kwargs):
+			if instance is capture.instance:
+				saves.append(update_fields)
+		
+		capture.instance = instance
+		pre_save.connect(capture, weak=False)
+		
+		try:
+			instance.save(**kwargs)
+		
+		finally:
+			pre_save.disconnect(capture)
+		
+		return saves
+	
+	def assertSavesFields(self, instance, fields, **kwargs):
+		"""
+		Saves ``instance`` and asserts that exactly ``fields`` were written.
+		
+		Fields may be given by name or attname. Any keyword arguments are
+		passed to :meth:`~django.db.models.Model.save`.
+		
+		"""
+		
+		saves = self._save_capturing_update_fields(instance, **kwargs)
+		
+		self.assertTrue(saves, 'Expected %r to be saved, but it was skipped.' % instance)
+		self.assertIsNotNone(saves[0], 'Expected %r to save only %s, but all fields were saved.' % (instance, sorted(fields)))
+		
+		def names(fields):
+			return set(instance._meta.get_field(name).name for name in fields)
+		
+		self.assertEqual(names(saves[0]), names(fields))
+	
+	def assertNoSave(self, instance, **kwargs):
+		"""
+		Saves ``instance`` and asserts that nothing was written.
+		
+		Any keyword arguments are passed
+		to :meth:`~django.db.models.Model.save`.
+		
+		"""
+		
+		with CaptureQueriesContext(connections[kwargs.get('using') or instance._state.db or DEFAULT_DB_ALIAS]) as queries:
+			saves = self._save_capturing_update_fields(instance, **kwargs)
+		
+		self.assertFalse(saves, 'Expected %r not to be saved, but it was with update_fields=%r.' % (instance, saves and saves[0]))
+		self.assertEqual(len(queries), 0, 'Expected no queries, but got:\n%s' % '\n'.join(query['sql'] for query in queries.captured_queries))
+	
+	def assertNumColumnsWritten(self, num, func=None, *args, **kwargs):
+		"""
+		Asserts that ``num`` columns in total were set by UPDATE statements
+		when calling ``func``, or within the block if used as a context
+		manager, just like :meth:`~django.test.TransactionTestCase.assertNumQueries`.
+		
+		"""
+		
+		using = kwargs.pop('using', DEFAULT_DB_ALIAS)
+		context = _AssertNumColumnsWrittenContext(self, num, connections[using])
+		
+		if func is None:
+			return context
+		
+		with context:
+			func(*args, **kwargs)
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import division, absolute_import, print_function, unicode_literals
+
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+__all__ = ('atomic',)
+
+
+@contextmanager
+def atomic(*instances, **kwargs):
+	"""
+	Wraps :func:`django.db.transaction.atomic`, restoring the given instances'
+	fields and tracked state if the block is rolled back.
+	
+	Without this, instances saved within a block that's then rolled back
+	believe they've nothing left to save, so retrying the block after
+	a :exc:`~django.db.utils.IntegrityError` would skip the very writes that
+	were lost. Instances are restored to a checkpoint taken on entering the
+	block (see :meth:`~django.db.models.Model.checkpoint`), so no refresh from
+	the database is needed.
+	
+	Usage:
+		>>> from save_the_change import transaction
+		>>> 
+		>>> with transaction.atomic(knight, squire):
+		... 	knight.save()
+		... 	squire.save()
+	
+	Only a rollback of this block itself is noticed, so instances should be
+	passed to the outermost block that might be rolled back.
+	
+	:param instances: instances decorated
+		with :func:`~save_the_change.decorators.TrackChanges`.
+	:param using: database alias, as with :func:`~django.db.transaction.atomic`.
+	:param savepoint: whether to use a savepoint, as
+		with :func:`~django.db.transaction.atomic`.
+	
+	"""
+	
+	using = kwargs.get('using')
+	checkpoints = [(instance, instance.checkpoint()) for instance in instances]
+	
+	def rollback():
+		for instance, checkpoint in checkpoints:
+			instance.rollback_to(checkpoint)
+	
+	with transaction.atomic(using=using, savepoint=kwargs.get('savepoint', True)):
+		try:
+			yield
+		
+		except Exception:
+			rollback()
+			
+			raise
+		
+		if transaction.get_rollback(using):
+			rollback()
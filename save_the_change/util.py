@@ -4,7 +4,9 @@ from __future__ import division, absolute_import, print_function, unicode_litera
 
 from datetime import date, time, datetime, timedelta, tzinfo
 from decimal import Decimal
+from itertools import islice
 from uuid import UUID
+from weakref import ref
 
 from django.utils import six
 
@@ -29,6 +31,30 @@ class DoesNotExist:
 	pass
 
 
+class Siblings(object):
+	"""
+	Weakly references a group of instances loaded together, so that work
+	needed by one of them can be done for all of them at once.
+	
+	Pickling or copying a group gives back an empty one, so instances holding
+	it can still be pickled or copied.
+	
+	"""
+	
+	def __init__(self, instances=()):
+		self.refs = [ref(instance) for instance in instances]
+	
+	def __iter__(self):
+		for instance_ref in self.refs:
+			instance = instance_ref()
+			
+			if instance is not None:
+				yield instance
+	
+	def __reduce__(self):
+		return (Siblings, ())
+
+
 def is_mutable(obj):
 	"""
 	Checks if given object is likely mutable.
@@ -59,3 +85,23 @@ def is_mutable(obj):
 			pass
 	
 	return False
+
+
+def chunked(iterable, size):
+	"""
+	Lazily splits an iterable into lists of at most ``size`` items.
+	
+	:param iterable: iterable to split.
+	:param size: maximum length of each chunk.
+	
+	:return: an iterator of :class:`list` chunks.
+	
+	"""
+	
+	iterator = iter(iterable)
+	chunk = list(islice(iterator, size))
+	
+	while chunk:
+		yield chunk
+		
+		chunk = list(islice(iterator, size))
@@ -25,7 +25,15 @@ MEDIA_ROOT = os.path.join(os.path.dirname(__file__), 'uploads')
 SECRET_KEY = 'q+xn9-%#q-u2zu*)utsl)wde%&k6ci88hqpjo1w9=2*@l*3ydl'
 
 INSTALLED_APPS = (
+	'save_the_change',
 	'testproject.testapp',
 )
 
+SAVE_THE_CHANGE_MODELS = {
+	'testapp.Relic': ('SaveTheChange', 'TrackChanges'),
+	'testapp.Casket': ('SaveTheChange', 'TrackChanges'),
+}
+
+SAVE_THE_CHANGE_BUFFER_INTERVAL = None
+
 TEST_RUNNER = 'django.test.runner.DiscoverRunner'
@@ -5,8 +5,11 @@ from __future__ import division, absolute_import, print_function, unicode_litera
 import os
 
 from django.db import models
+from django.utils.text import slugify
 
-from save_the_change.decorators import SaveTheChange, TrackChanges, UpdateTogether
+from save_the_change.comparators import approximately, same_instant, same_json
+from save_the_change.decorators import SaveTheChange, TrackChanges, UpdateTogether, Comparators, SaveHook, Appendable, RowVersion, computed_field
+from save_the_change.querysets import TrackedQuerySet
 
 
 @TrackChanges
@@ -93,3 +96,241 @@ class EnlightenedModel(models.Model):
 		super(EnlightenedModel, self).save(*args, **kwargs)
 		
 		self.save_ended = True
+
+
+@SaveTheChange
+@TrackChanges
+class Pilgrim(models.Model):
+	"""
+	A model to test bulk saving.
+	
+	"""
+	
+	external_id = models.IntegerField(unique=True)
+	name = models.CharField(max_length=32)
+	miles = models.IntegerField(default=0)
+	
+	objects = TrackedQuerySet.as_manager()
+
+
+@SaveTheChange
+@TrackChanges
+@Comparators(weight=approximately(abs_tol=0.001), offered_at=same_instant, manifest=same_json)
+class Alms(models.Model):
+	"""
+	A model to test comparators.
+	
+	"""
+	
+	weight = models.FloatField()
+	offered_at = models.DateTimeField()
+	manifest = models.TextField()
+	price = models.DecimalField(max_digits=5, decimal_places=2)
+
+
+@SaveTheChange
+@TrackChanges
+class Sutra(models.Model):
+	"""
+	A model to test computed fields.
+	
+	"""
+	
+	title = models.CharField(max_length=32)
+	body = models.TextField()
+	slug = models.SlugField()
+	word_count = models.IntegerField(default=0)
+	summary = models.CharField(max_length=64, default='')
+	
+	@computed_field('slug', depends_on=('title',))
+	def compute_slug(self):
+		self.__dict__.setdefault('computed', []).append('slug')
+		
+		return slugify(self.title)
+	
+	@computed_field('word_count', depends_on=('body',))
+	def compute_word_count(self):
+		self.__dict__.setdefault('computed', []).append('word_count')
+		
+		return len(self.body.split())
+	
+	@computed_field('summary', depends_on=('slug', 'word_count'))
+	def compute_summary(self):
+		self.__dict__.setdefault('computed', []).append('summary')
+		
+		return '%s (%s words)' % (self.slug, self.word_count)
+
+
+class Relic(models.Model):
+	"""
+	A model to test lazily decorating models listed in settings.
+	
+	"""
+	
+	name = models.CharField(max_length=32)
+	stupa = models.CharField(max_length=32)
+
+
+class Reliquary(Relic):
+	"""
+	A model to test inheriting from lazily decorated models.
+	
+	"""
+	
+	casket = models.CharField(max_length=32)
+
+
+class Casket(models.Model):
+	"""
+	A model to test lazily decorating models first loaded with deferred
+	fields.
+	
+	"""
+	
+	name = models.CharField(max_length=32)
+	material = models.CharField(max_length=32)
+
+
+@SaveTheChange
+@TrackChanges
+@UpdateTogether(('name', 'height'))
+class Stupa(models.Model):
+	"""
+	A model to test multi-table inheritance.
+	
+	"""
+	
+	name = models.CharField(max_length=32)
+	height = models.IntegerField(default=0)
+	relics = models.IntegerField(default=0)
+
+
+class Pagoda(Stupa):
+	"""
+	A model to test inheriting from a decorated model without decorating it.
+	
+	"""
+	
+	tiers = models.IntegerField(default=1)
+	roof = models.CharField(max_length=32, default='tile')
+
+
+class Vihara(models.Model):
+	"""
+	A model to test decorating a model inheriting from an undecorated one.
+	
+	"""
+	
+	name = models.CharField(max_length=32)
+
+
+@SaveTheChange
+@TrackChanges
+class Monastery(Vihara):
+	"""
+	A model to test decorating a model inheriting from an undecorated one.
+	
+	"""
+	
+	monks = models.IntegerField(default=0)
+
+
+class Ascetic(models.Model):
+	"""
+	A model to test diagnosing full-row saves of undecorated models.
+	
+	"""
+	
+	name = models.CharField(max_length=32)
+	vows = models.IntegerField(default=0)
+	fasts = models.IntegerField(default=0)
+
+
+def count_edits(instance, *args, **kwargs):
+	if kwargs.get('update_fields'):
+		instance.edits += 1
+		kwargs['update_fields'] = list(kwargs['update_fields']) + ['edits']
+	
+	return (True, args, kwargs)
+
+
+@SaveTheChange
+@SaveHook(count_edits)
+@UpdateTogether(('edits', 'copies'))
+class Scribe(models.Model):
+	"""
+	A model to test adding save hooks.
+	
+	"""
+	
+	text = models.TextField()
+	edits = models.IntegerField(default=0)
+	copies = models.IntegerField(default=0)
+
+
+@SaveTheChange(buffered=('visits', 'offerings'))
+@TrackChanges
+class Shrine(models.Model):
+	"""
+	A model to test buffered counters.
+	
+	"""
+	
+	name = models.CharField(max_length=32)
+	visits = models.IntegerField(default=0)
+	offerings = models.IntegerField(default=0)
+
+
+@SaveTheChange
+@TrackChanges
+@Appendable('chronicle')
+class Chronicle(models.Model):
+	"""
+	A model to test appendable fields.
+	
+	"""
+	
+	title = models.CharField(max_length=32)
+	chronicle = models.TextField(default='')
+
+
+@SaveTheChange
+@TrackChanges
+@RowVersion('version')
+class Sangha(models.Model):
+	"""
+	A model to test row versions.
+	
+	"""
+	
+	name = models.CharField(max_length=32)
+	members = models.IntegerField(default=0)
+	version = models.IntegerField(default=0)
+
+
+@SaveTheChange
+@TrackChanges
+class Precept(models.Model):
+	"""
+	A model to test validating only changed fields.
+	
+	"""
+	
+	school = models.CharField(max_length=32)
+	number = models.IntegerField()
+	text = models.CharField(max_length=32)
+	
+	class Meta:
+		unique_together = (('school', 'number'),)
+
+
+@SaveTheChange
+@TrackChanges
+class Thangka(models.Model):
+	"""
+	A model to test loading fields with descriptors of their own.
+	
+	"""
+	
+	name = models.CharField(max_length=32)
+	scroll = models.FileField(upload_to='./', blank=True)
@@ -4,20 +4,46 @@ from __future__ import division, absolute_import, print_function, unicode_litera
 
 import datetime
 import os
+import pickle
 import pytz
+import sys
 import warnings
 from decimal import Decimal
+from unittest import skipIf
 
 import django
+from django import forms
+from django.core.exceptions import ValidationError
 from django.core.files import File
 from django.core.files.images import ImageFile
-from django.db import models
-from django.test import TestCase
+from django.db import IntegrityError, OperationalError, connection, models, transaction
+from django.db.transaction import TransactionManagementError
+from django.db.models import Value
+from django.db.models.functions import Concat
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 
-from testproject.testapp.models import Enlightenment, EnlightenedModel, Disorder
+from testproject.testapp.models import Enlightenment, EnlightenedModel, Disorder, Pilgrim, Alms, Sutra, Relic, Reliquary, Casket, Stupa, Pagoda, Vihara, Monastery, Ascetic, Scribe, Shrine, Chronicle, Sangha, Precept, Thangka, count_edits
 
-from save_the_change.decorators import _save_the_change_save_hook, _update_together_save_hook
+from save_the_change.apps import PENDING_MODELS, install_lazily
+from save_the_change import buffering, bulk
+from save_the_change.buffering import CounterBuffer
+from save_the_change.bulk import bulk_save, parallel_bulk_save, sync_records
+from save_the_change.comparators import COMPARATORS, same_number
+from save_the_change.descriptors import ChangeTrackingDescriptor
+from save_the_change.decorators import _save_the_change_save_hook, _update_together_save_hook, _computed_fields_save_hook, _update_together, _add_save_hook
+from save_the_change.diagnostics import WastedWrites
+from save_the_change.forms import TrackedModelFormMixin
+from save_the_change.identity import IdentityMapMiddleware, identity_map
 from save_the_change.mixins import SaveTheChange, TrackChanges, UpdateTogetherModel
+from save_the_change.records import TrackedRecord, save_records
+from save_the_change.testing import SaveAssertionsMixin, _UPDATE, _columns_written
+from save_the_change import transaction as stc_transaction
+
+if sys.version_info >= (3, 5):
+	import asyncio
+	
+	from save_the_change import asynchronous
 
 
 ATTR_MISSING = object()
@@ -98,8 +124,9 @@ class EnlightenedModelTestCase(TestCase):
 		
 		# When assigning a file initially to {File,Image}Field, Django replaces
 		# it with a FieldFile instance. We need to grab that instance for
-		# testing, which trips our mutability checks. This isn't at all a bug,
-		# but requires some extra boilerplate for equality tests.
+		# testing, which trips our mutability checks (though only its name is
+		# snapshotted). This isn't at all a bug, but requires some extra
+		# boilerplate for equality tests.
 		self.always_in__mutable_fields = {'file': self.old_values['file'], 'image': self.old_values['image']}
 	
 	def create_initial(self):
@@ -152,6 +179,10 @@ class EnlightenedModelTestCase(TestCase):
 	def get_model_attrs(self, model):
 		return {attr: getattr(model, attr, ATTR_MISSING) for attr in self.new_values}
 	
+	def without_related(self, values):
+		# ForeignKeys are only tracked (and keyed in old_values) by attname.
+		return {k: v for k, v in values.items() if k != 'enlightenment'}
+	
 	def test_initial__changed_fields(self):
 		m = self.create_initial()
 		
@@ -175,7 +206,7 @@ class EnlightenedModelTestCase(TestCase):
 	def test_initial_old_values(self):
 		m = self.create_initial()
 		
-		self.assertEquals(dict(m.old_values), self.old_values)
+		self.assertEquals(dict(m.old_values), self.without_related(self.old_values))
 	
 	def test_old_values_with_bad_key(self):
 		m = self.create_initial()
@@ -210,6 +241,7 @@ class EnlightenedModelTestCase(TestCase):
 		del(old_values['holism'])
 		del(old_values['file'])
 		del(old_values['image'])
+		del(old_values['enlightenment'])
 		
 		self.assertEquals(m._changed_fields, old_values)
 	
@@ -217,27 +249,23 @@ class EnlightenedModelTestCase(TestCase):
 		m = self.create_initial()
 		m.enlightenment
 		m.holism.all()
-		mutable_fields = {'enlightenment': self.old_values['enlightenment']}
-		mutable_fields.update(self.always_in__mutable_fields)
 		
-		self.assertEquals(m._mutable_fields, mutable_fields)
+		self.assertEquals(m._mutable_fields, self.always_in__mutable_fields)
 	
 	def test_changed_inside_mutable_field__mutable_fields(self):
 		m = self.create_initial()
 		m.enlightenment.aspect = 'Holistic'
-		old_values = {'enlightenment': self.old_values['enlightenment']}
-		old_values.update(self.always_in__mutable_fields)
 		
-		self.assertEquals(m._mutable_fields, old_values)
+		self.assertEquals(m._mutable_fields, self.always_in__mutable_fields)
+		self.assertEquals(m.changed_fields, set())
 	
 	def test_touched_then_changed_inside_mutable_field__mutable_fields(self):
 		m = self.create_initial()
 		m.enlightenment
 		m.enlightenment = self.new_values['enlightenment']
-		mutable_fields = {'enlightenment': self.old_values['enlightenment']}
-		mutable_fields.update(self.always_in__mutable_fields)
 		
-		self.assertEquals(m._mutable_fields, mutable_fields)
+		self.assertEquals(m._mutable_fields, self.always_in__mutable_fields)
+		self.assertEquals(m._changed_fields, {'enlightenment_id': self.old_values['enlightenment_id']})
 	
 	def test_touched_immutable_field_with_mutable_element__mutable_fields(self):
 		m = self.create_initial()
@@ -262,6 +290,7 @@ class EnlightenedModelTestCase(TestCase):
 		new_values = self.new_values
 		del(new_values['id'])
 		del(new_values['holism'])
+		del(new_values['enlightenment'])
 		
 		self.assertEquals(sorted(m.changed_fields), sorted(new_values.keys()))
 	
@@ -278,7 +307,7 @@ class EnlightenedModelTestCase(TestCase):
 	def test_changed_old_values(self):
 		m = self.create_changed()
 		
-		self.assertEquals(dict(m.old_values), self.old_values)
+		self.assertEquals(dict(m.old_values), self.without_related(self.old_values))
 	
 	def test_changed_reverts(self):
 		m = self.create_changed()
@@ -292,6 +321,25 @@ class EnlightenedModelTestCase(TestCase):
 		
 		self.assertEquals(self.get_model_attrs(m), self.new_values)
 	
+	def test_changed_foreign_key_reverts_without_queries(self):
+		m = self.create_initial()
+		m = EnlightenedModel.objects.get(pk=m.pk)
+		
+		def change_and_revert():
+			m.enlightenment = self.wisdom
+			
+			self.assertEquals(m.changed_fields, {'enlightenment_id'})
+			self.assertEquals(m.old_values['enlightenment_id'], self.knowledge.id)
+			self.assertRaises(KeyError, lambda: m.old_values['enlightenment'])
+			
+			m.revert_fields('enlightenment')
+			
+			self.assertEquals(m.enlightenment_id, self.knowledge.id)
+			self.assertEquals(m.changed_fields, set())
+		
+		self.assertNumQueries(0, change_and_revert)
+		self.assertEquals(m.enlightenment, self.knowledge)
+	
 	def test_changed_reverts_all(self):
 		m = self.create_changed()
 		m.revert_fields('enlightenment')
@@ -323,7 +371,7 @@ class EnlightenedModelTestCase(TestCase):
 	def test_reverted_old_values(self):
 		m = self.create_reverted()
 		
-		self.assertEquals(dict(m.old_values), self.old_values)
+		self.assertEquals(dict(m.old_values), self.without_related(self.old_values))
 	
 	def test_saved__changed_fields(self):
 		m = self.create_saved()
@@ -348,7 +396,7 @@ class EnlightenedModelTestCase(TestCase):
 	def test_saved_old_values(self):
 		m = self.create_saved()
 		
-		self.assertEquals(dict(m.old_values), self.new_values)
+		self.assertEquals(dict(m.old_values), self.without_related(self.new_values))
 	
 	def test_changed_twice_new_values(self):
 		m = self.create_changed()
@@ -384,9 +432,9 @@ class EnlightenedModelTestCase(TestCase):
 	def test_save_hook_order_with_out_of_order_decorators(self):
 		self.assertEquals(Disorder._meta._stc_save_hooks, [_save_the_change_save_hook, _update_together_save_hook])
 	
-	def update_together_with_multiple_decorators(self):
+	def test_update_together_with_multiple_decorators(self):
 		together = {'chaos', 'fire', 'brimstone'}
-		self.assertEquals(Disorder._meta.update_together, {field: together for field in together})
+		self.assertEquals(_update_together(Disorder._meta), {field: together for field in together})
 	
 	def test_altered_file_field(self):
 		m = self.create_initial()
@@ -400,6 +448,59 @@ class EnlightenedModelTestCase(TestCase):
 		
 		self.assertEquals(m.changed_fields, set())
 	
+	def test_file_field_snapshot_shares_storage(self):
+		m = self.create_initial()
+		m = EnlightenedModel.objects.get(pk=m.pk)
+		m.file
+		
+		self.assertEquals(m._mutable_fields['file'], m.file)
+		self.assertIsNot(m._mutable_fields['file'], m.file)
+		self.assertIs(m._mutable_fields['file'].storage, m.file.storage)
+		self.assertIs(m._mutable_fields['file']._file, None)
+	
+	def test_state_version(self):
+		m = self.create_initial()
+		version = m.state_version
+		
+		m.text
+		m.comma_seperated_integer
+		
+		self.assertEquals(m.state_version, version)
+		
+		m.text = self.new_values['text']
+		
+		self.assertNotEquals(m.state_version, version)
+		
+		version = m.state_version
+		m.save()
+		
+		self.assertNotEquals(m.state_version, version)
+	
+	def test_changed_fields_sees_mutable_changes(self):
+		m = self.create_initial()
+		m.comma_seperated_integer = [4, 8, 15]
+		m._changed_fields = {}
+		
+		self.assertEquals(m.changed_fields, set())
+		
+		m.comma_seperated_integer.append(16)
+		
+		self.assertEquals(m.changed_fields, {'comma_seperated_integer'})
+	
+	def test_has_changed_sees_changes_through_earlier_references(self):
+		m = self.create_initial()
+		m.comma_seperated_integer = [4, 8, 15]
+		m._changed_fields = {}
+		reference = m.comma_seperated_integer
+		
+		self.assertEquals(m.has_changed, False)
+		self.assertEquals(m.changed_fields, set())
+		
+		reference.append(16)
+		
+		self.assertEquals(m.has_changed, True)
+		self.assertEquals(m.changed_fields, {'comma_seperated_integer'})
+	
 	def test_refresh_from_db(self):
 		m = self.create_changed()
 		m.refresh_from_db()
@@ -496,3 +597,1183 @@ class EnlightenedModelTestCase(TestCase):
 		
 		self.old_values.pop('id', None)
 		self.new_values.pop('id', None)
+
+
+class BulkTestCase(TestCase):
+	def setUp(self):
+		super(BulkTestCase, self).setUp()
+		
+		for external_id, name in enumerate(('Ananda', 'Kassapa', 'Sariputta')):
+			Pilgrim.objects.create(external_id=external_id, name=name)
+	
+	def test_bulk_save_groups_changes(self):
+		pilgrims = list(Pilgrim.objects.order_by('external_id'))
+		pilgrims[0].miles = 10
+		pilgrims[1].miles = 20
+		
+		self.assertNumQueries(1, lambda: self.assertEquals(bulk_save(pilgrims), 2))
+		self.assertEquals(list(Pilgrim.objects.order_by('external_id').values_list('miles', flat=True)), [10, 20, 0])
+		self.assertEquals(pilgrims[0].changed_fields, set())
+	
+	def test_bulk_save_without_changes(self):
+		pilgrims = list(Pilgrim.objects.all())
+		
+		self.assertNumQueries(0, lambda: self.assertEquals(bulk_save(pilgrims), 0))
+	
+	def test_sync_records(self):
+		records = [
+			{'external_id': 0, 'name': 'Ananda'},
+			{'external_id': 1, 'name': 'Mahakassapa'},
+			{'external_id': 3, 'name': 'Moggallana'},
+		]
+		
+		self.assertNumQueries(3, lambda: self.assertEquals(sync_records(Pilgrim, records, chunk_size=10), (1, 1)))
+		self.assertEquals(
+			list(Pilgrim.objects.order_by('external_id').values_list('name', flat=True)),
+			['Ananda', 'Mahakassapa', 'Sariputta', 'Moggallana']
+		)
+	
+	def test_sync_records_in_chunks(self):
+		records = ({'external_id': external_id, 'name': 'Pilgrim %s' % external_id} for external_id in range(5))
+		
+		self.assertNumQueries(7, lambda: self.assertEquals(sync_records(Pilgrim, records, chunk_size=2), (2, 3)))
+	
+	def test_tracked_records(self):
+		records = list(Pilgrim.objects.order_by('external_id').tracked_records('miles'))
+		records[0].miles = 10
+		records[1].miles = 20
+		records[2].miles = 30
+		records[2].miles = 0
+		
+		self.assertFalse(hasattr(records[0], '__dict__'))
+		self.assertEquals(records[0].changed_fields, {'miles'})
+		self.assertEquals(records[2].has_changed, False)
+		self.assertNumQueries(1, lambda: self.assertEquals(save_records(records), 2))
+		self.assertEquals(list(Pilgrim.objects.order_by('external_id').values_list('miles', flat=True)), [10, 20, 0])
+		self.assertEquals(records[0].has_changed, False)
+	
+	def test_deferred_fields_loaded_for_siblings(self):
+		pilgrims = list(Pilgrim.objects.order_by('external_id').only('name'))
+		
+		self.assertNumQueries(1, lambda: self.assertEquals([pilgrim.miles for pilgrim in pilgrims], [0, 0, 0]))
+		self.assertEquals([pilgrim.changed_fields for pilgrim in pilgrims], [set(), set(), set()])
+		
+		pilgrims[2].miles = 5
+		
+		self.assertEquals(pilgrims[2].changed_fields, {'miles'})
+		self.assertNumQueries(1, lambda: pilgrims[2].save())
+	
+	def test_deferred_siblings_pickle(self):
+		pilgrim = pickle.loads(pickle.dumps(list(Pilgrim.objects.only('name'))[0]))
+		
+		self.assertEquals(pilgrim.miles, 0)
+	
+	def test_update_or_create_without_changes(self):
+		self.assertNumQueries(1, lambda: Pilgrim.objects.update_or_create(external_id=0, defaults={'name': 'Ananda', 'miles': 0}))
+	
+	def test_update_or_create_writes_changed_fields(self):
+		with CaptureQueriesContext(connection) as queries:
+			pilgrim, created = Pilgrim.objects.update_or_create(external_id=0, defaults={'name': 'Ananda', 'miles': 10})
+		
+		self.assertFalse(created)
+		self.assertEquals(len(queries), 2)
+		self.assertNotIn('"name"', queries[1]['sql'])
+		self.assertEquals(Pilgrim.objects.values_list('name', 'miles').get(external_id=0), ('Ananda', 10))
+	
+	def test_update_or_create_creates(self):
+		pilgrim, created = Pilgrim.objects.update_or_create(external_id=5, defaults={'name': 'Moggallana'})
+		
+		self.assertTrue(created)
+		self.assertEquals(Pilgrim.objects.get(external_id=5).name, 'Moggallana')
+	
+	def test_parallel_bulk_save_reports_failures(self):
+		pilgrims = list(Pilgrim.objects.order_by('external_id'))
+		pilgrims[0].miles = 10
+		pilgrims[1].external_id = 2
+		
+		written, failures = parallel_bulk_save(pilgrims, workers=1)
+		
+		self.assertEquals(written, 1)
+		self.assertEquals([instances for instances, exception in failures], [[pilgrims[1]]])
+		self.assertIsInstance(failures[0][1], IntegrityError)
+		self.assertEquals(pilgrims[0].changed_fields, set())
+		self.assertEquals(pilgrims[1].changed_fields, {'external_id'})
+		self.assertEquals(list(Pilgrim.objects.order_by('external_id').values_list('external_id', 'miles')), [(0, 10), (1, 0), (2, 0)])
+
+
+class ComparatorsTestCase(TestCase):
+	def setUp(self):
+		super(ComparatorsTestCase, self).setUp()
+		
+		Alms.objects.create(
+			weight=1.5,
+			offered_at=pytz.utc.localize(datetime.datetime(1999, 12, 31, 23, 59, 59)),
+			manifest='{"rice": 1, "tea": 2}',
+			price=Decimal('1.50'),
+		)
+		
+		self.alms = Alms.objects.get()
+	
+	def test_equal_values_are_unchanged(self):
+		self.alms.weight = 1.5001
+		self.alms.offered_at = datetime.datetime(1999, 12, 31, 23, 59, 59)
+		self.alms.manifest = '{"tea": 2, "rice": 1}'
+		
+		self.assertEquals(self.alms.changed_fields, set())
+		self.assertNumQueries(0, lambda: self.alms.save())
+	
+	def test_unequal_values_are_changed(self):
+		self.alms.weight = 1.6
+		self.alms.manifest = '{"tea": 3, "rice": 1}'
+		
+		self.assertEquals(self.alms.changed_fields, {'weight', 'manifest'})
+	
+	def test_reverting_with_comparator(self):
+		self.alms.weight = 1.6
+		self.alms.weight = 1.5001
+		
+		self.assertEquals(self.alms.changed_fields, set())
+	
+	def test_drift_is_compared_to_original(self):
+		for step in range(1, 11):
+			self.alms.weight = 1.5 + step * 0.0009
+		
+		self.assertEquals(self.alms.changed_fields, {'weight'})
+		
+		self.alms.save()
+		
+		self.assertAlmostEqual(Alms.objects.get().weight, 1.509)
+	
+	def test_comparators_with_deferred_fields(self):
+		alms = Alms.objects.defer('weight').get()
+		
+		alms.weight = 1.5001
+		
+		self.assertEquals(alms.changed_fields, set())
+	
+	def test_registered_type_comparator(self):
+		self.alms.price = '1.5'
+		
+		self.assertEquals(self.alms.changed_fields, {'price'})
+		
+		COMPARATORS[Decimal] = same_number
+		
+		try:
+			self.alms.refresh_from_db()
+			self.alms.price = '1.5'
+			
+			self.assertEquals(self.alms.changed_fields, set())
+		
+		finally:
+			del(COMPARATORS[Decimal])
+
+
+class ComputedFieldTestCase(TestCase):
+	def setUp(self):
+		super(ComputedFieldTestCase, self).setUp()
+		
+		Sutra.objects.create(title='Heart Sutra', body='Form is emptiness')
+		
+		self.sutra = Sutra.objects.get()
+	
+	def test_computed_on_create(self):
+		self.assertEquals(self.sutra.slug, 'heart-sutra')
+		self.assertEquals(self.sutra.word_count, 3)
+		self.assertEquals(self.sutra.summary, 'heart-sutra (3 words)')
+	
+	def test_only_dependents_recomputed(self):
+		self.sutra.title = 'Diamond Sutra'
+		self.sutra.save()
+		
+		self.assertEquals(self.sutra.computed, ['slug', 'summary'])
+		self.assertEquals(Sutra.objects.values_list('slug', 'summary').get(), ('diamond-sutra', 'diamond-sutra (3 words)'))
+	
+	def test_nothing_recomputed_without_changes(self):
+		self.sutra.save()
+		
+		self.assertEquals(getattr(self.sutra, 'computed', []), [])
+	
+	def test_save_hook_order(self):
+		self.assertEquals(Sutra._meta._stc_save_hooks, [_save_the_change_save_hook, _computed_fields_save_hook])
+
+
+class LazyInjectionTestCase(TestCase):
+	def test_decorated_on_first_instantiation(self):
+		self.assertEquals(Relic in PENDING_MODELS, not hasattr(Relic._meta, '_stc_injected'))
+		
+		Relic.objects.create(name='Tooth', stupa='Kandy')
+		
+		self.assertNotIn(Relic, PENDING_MODELS)
+		self.assertEquals(Relic._meta._stc_save_hooks, [_save_the_change_save_hook])
+		
+		relic = Relic.objects.get()
+		relic.stupa = 'Sanchi'
+		
+		self.assertEquals(relic.changed_fields, {'stupa'})
+		self.assertNumQueries(1, lambda: relic.save())
+		self.assertNumQueries(0, lambda: relic.save())
+	
+	def test_pending_until_decorated(self):
+		class Options(object):
+			pass
+		
+		class Lazy(object):
+			_meta = Options()
+		
+		pending = []
+		
+		install_lazily(Lazy, [lambda klass: pending.append(klass in PENDING_MODELS)])
+		Lazy()
+		
+		self.assertEquals(pending, [True])
+		self.assertNotIn(Lazy, PENDING_MODELS)
+	
+	def test_subclasses_decorated(self):
+		Reliquary.objects.create(name='Tooth', stupa='Kandy', casket='Gold')
+		
+		reliquary = Reliquary.objects.get()
+		reliquary.casket = 'Silver'
+		
+		self.assertEquals(reliquary.changed_fields, {'casket'})
+		self.assertNumQueries(1, lambda: reliquary.save())
+		self.assertEquals(Reliquary.objects.get().casket, 'Silver')
+	
+	def test_first_loaded_deferred(self):
+		# Without instantiating it, so that it's first loaded below.
+		with connection.cursor() as cursor:
+			cursor.execute("INSERT INTO testapp_casket (name, material) VALUES ('Piprahwa', 'Soapstone')")
+		
+		casket = Casket.objects.only('name').get()
+		casket.name = 'Bimaran'
+		
+		self.assertEquals(casket.changed_fields, {'name'})
+		self.assertNumQueries(1, lambda: casket.save())
+		self.assertEquals(Casket.objects.values_list('name', 'material').get(), ('Bimaran', 'Soapstone'))
+
+
+class MultiTableInheritanceTestCase(TestCase):
+	def setUp(self):
+		super(MultiTableInheritanceTestCase, self).setUp()
+		
+		Pagoda.objects.create(name='Horyu-ji', height=32, tiers=5)
+		Monastery.objects.create(name='Nalanda', monks=10000)
+		
+		self.pagoda = Pagoda.objects.get()
+		self.monastery = Monastery.objects.get()
+	
+	def assertTablesUpdated(self, tables, func):
+		with CaptureQueriesContext(connection) as context:
+			func()
+		
+		self.assertEquals(
+			sorted(query['sql'].split('"')[1] for query in context.captured_queries),
+			sorted(tables),
+		)
+	
+	def test_inherits_decoration(self):
+		self.assertEquals(Pagoda._meta._stc_save_hooks, Stupa._meta._stc_save_hooks)
+		self.assertEquals(self.pagoda.changed_fields, set())
+		self.assertEquals(self.pagoda._meta._stc_pk_attnames, {'id', 'stupa_ptr_id'})
+	
+	def test_child_change_skips_parent_table(self):
+		self.pagoda.tiers = 7
+		
+		self.assertEquals(self.pagoda.changed_fields, {'tiers'})
+		self.assertTablesUpdated(['testapp_pagoda'], self.pagoda.save)
+	
+	def test_parent_change_skips_child_table(self):
+		self.pagoda.relics = 3
+		
+		self.assertTablesUpdated(['testapp_stupa'], self.pagoda.save)
+		self.assertEquals(Stupa.objects.get().relics, 3)
+	
+	def test_parent_update_together(self):
+		self.pagoda.name = 'Toji'
+		self.pagoda.roof = 'copper'
+		
+		self.assertTablesUpdated(['testapp_pagoda', 'testapp_stupa'], self.pagoda.save)
+		self.assertEquals(Pagoda.objects.values_list('name', 'height', 'roof').get(), ('Toji', 32, 'copper'))
+	
+	def test_deferred_parent_field(self):
+		pagoda = Pagoda.objects.only('tiers').get()
+		
+		self.assertNumQueries(1, lambda: self.assertEquals(pagoda.name, 'Horyu-ji'))
+		self.assertEquals(pagoda.changed_fields, set())
+	
+	def test_undecorated_parent(self):
+		self.monastery.name = 'Vikramashila'
+		
+		self.assertEquals(self.monastery.changed_fields, {'name'})
+		self.assertTablesUpdated(['testapp_vihara'], self.monastery.save)
+		self.assertEquals(Vihara.objects.get().name, 'Vikramashila')
+		self.assertNumQueries(0, self.monastery.save)
+
+
+class CheckpointTestCase(TestCase):
+	def setUp(self):
+		super(CheckpointTestCase, self).setUp()
+		
+		Pilgrim.objects.create(external_id=0, name='Ananda')
+		Pilgrim.objects.create(external_id=1, name='Kassapa')
+		
+		self.pilgrim = Pilgrim.objects.get(external_id=0)
+	
+	def test_rollback_to_checkpoint(self):
+		self.pilgrim.miles = 10
+		checkpoint = self.pilgrim.checkpoint()
+		
+		self.pilgrim.miles = 20
+		self.pilgrim.name = 'Mahakassapa'
+		
+		self.assertNumQueries(0, lambda: self.pilgrim.rollback_to(checkpoint))
+		self.assertEquals((self.pilgrim.name, self.pilgrim.miles), ('Ananda', 10))
+		self.assertEquals(self.pilgrim.changed_fields, {'miles'})
+		self.assertEquals(self.pilgrim.old_values['miles'], 0)
+	
+	def test_rollback_to_checkpoint_across_save(self):
+		checkpoint = self.pilgrim.checkpoint()
+		
+		self.pilgrim.name = 'Mahakassapa'
+		self.pilgrim.save()
+		self.pilgrim.name = 'Moggallana'
+		self.pilgrim.rollback_to(checkpoint)
+		
+		self.assertEquals(self.pilgrim.name, 'Ananda')
+		self.assertEquals(self.pilgrim.changed_fields, set())
+	
+	def test_atomic_restores_on_rollback(self):
+		self.pilgrim.miles = 10
+		
+		with self.assertRaises(IntegrityError):
+			with stc_transaction.atomic(self.pilgrim):
+				self.pilgrim.save()
+				self.pilgrim.external_id = 1
+				self.pilgrim.save()
+		
+		self.assertEquals((self.pilgrim.external_id, self.pilgrim.miles), (0, 10))
+		self.assertEquals(self.pilgrim.changed_fields, {'miles'})
+		
+		self.pilgrim.save()
+		
+		self.assertEquals(Pilgrim.objects.get(external_id=0).miles, 10)
+	
+	def test_atomic_restores_on_set_rollback(self):
+		with stc_transaction.atomic(self.pilgrim):
+			self.pilgrim.miles = 10
+			self.pilgrim.save()
+			transaction.set_rollback(True)
+		
+		self.assertEquals(self.pilgrim.miles, 0)
+		self.assertEquals(Pilgrim.objects.get(external_id=0).miles, 0)
+
+
+class SaveHookTestCase(TestCase):
+	def test_save_hook_order(self):
+		self.assertEquals(Scribe._meta._stc_save_hooks, [_save_the_change_save_hook, count_edits, _update_together_save_hook])
+	
+	def test_save_hooks_run(self):
+		scribe = Scribe.objects.create(text='Dhammapada', copies=3)
+		scribe.text = 'Sutta Nipata'
+		
+		with CaptureQueriesContext(connection) as queries:
+			scribe.save()
+		
+		self.assertEquals(scribe.edits, 1)
+		self.assertEquals(len(queries), 1)
+		
+		for column in ('"text"', '"edits"', '"copies"'):
+			self.assertIn(column, queries[0]['sql'])
+		
+		self.assertNumQueries(0, scribe.save)
+	
+	def test_save_hooks_recompiled(self):
+		Scribe.objects.create(text='Dhammapada').save()
+		
+		self.assertIsNotNone(Scribe._meta._stc_run_save_hooks)
+		
+		def skip_save(instance, *args, **kwargs):
+			return (False, args, kwargs)
+		
+		_add_save_hook(Scribe, skip_save, 0)
+		
+		try:
+			self.assertIsNone(Scribe._meta._stc_run_save_hooks)
+			self.assertNumQueries(0, Scribe(text='Sutta Nipata').save)
+		
+		finally:
+			Scribe._meta._stc_save_hook_orders = [entry for entry in Scribe._meta._stc_save_hook_orders if entry[1] is not skip_save]
+			Scribe._meta._stc_save_hooks.remove(skip_save)
+			Scribe._meta._stc_run_save_hooks = None
+
+
+class FromDbTestCase(TestCase):
+	def setUp(self):
+		super(FromDbTestCase, self).setUp()
+		
+		Pilgrim.objects.create(external_id=0, name='Ananda')
+	
+	@skipIf(django.VERSION < (1, 10), "Rows are only loaded without descriptors on Django 1.10+.")
+	def test_loaded_without_descriptors(self):
+		initialized = []
+		__set__ = ChangeTrackingDescriptor.__set__
+		
+		def receiver(sender, instance, **kwargs):
+			initialized.append(instance)
+		
+		def fail(self, instance, value):
+			raise AssertionError('%s assigned through its descriptor.' % self.name)
+		
+		models.signals.post_init.connect(receiver, sender=Pilgrim)
+		ChangeTrackingDescriptor.__set__ = fail
+		
+		try:
+			pilgrim = Pilgrim.objects.get()
+			deferred = Pilgrim.objects.only('name').get()
+		
+		finally:
+			ChangeTrackingDescriptor.__set__ = __set__
+			models.signals.post_init.disconnect(receiver, sender=Pilgrim)
+		
+		self.assertEquals(initialized, [pilgrim, deferred])
+		self.assertEquals((pilgrim.external_id, pilgrim.name, pilgrim.miles), (0, 'Ananda', 0))
+		self.assertFalse(pilgrim._state.adding)
+		self.assertEquals(deferred.get_deferred_fields(), {'external_id', 'miles'})
+		
+		pilgrim.miles = 10
+		
+		self.assertEquals(pilgrim.changed_fields, {'miles'})
+	
+	def test_loaded_through_descriptors_that_assign(self):
+		Thangka.objects.create(name='Wheel of Life', scroll='wheel.png')
+		thangka = Thangka.objects.get()
+		
+		self.assertFalse(Thangka._meta._stc_plain_init)
+		self.assertEquals(thangka.scroll.name, 'wheel.png')
+		self.assertEquals(thangka.changed_fields, set())
+
+
+class IdentityMapTestCase(TestCase):
+	def setUp(self):
+		super(IdentityMapTestCase, self).setUp()
+		
+		self.pk = Pilgrim.objects.create(external_id=0, name='Ananda').pk
+	
+	def test_same_instance_within_map(self):
+		with identity_map():
+			pilgrim = Pilgrim.objects.get(external_id=0)
+			pilgrim.miles = 10
+			
+			self.assertIs(Pilgrim.objects.filter(name='Ananda')[0], pilgrim)
+			
+			with self.assertNumQueries(0):
+				self.assertIs(Pilgrim.objects.get(pk=str(self.pk)), pilgrim)
+			
+			self.assertEquals(pilgrim.changed_fields, {'miles'})
+		
+		self.assertIsNot(Pilgrim.objects.get(pk=self.pk), pilgrim)
+	
+	def test_fills_deferred_fields(self):
+		with identity_map():
+			pilgrim = Pilgrim.objects.only('name').get(pk=self.pk)
+			pilgrim.name = 'Mahakassapa'
+			
+			self.assertIs(Pilgrim.objects.filter(pk=self.pk).first(), pilgrim)
+			
+			with self.assertNumQueries(0):
+				self.assertEquals((pilgrim.name, pilgrim.miles), ('Mahakassapa', 0))
+	
+	def test_refresh_from_db(self):
+		with identity_map():
+			pilgrim = Pilgrim.objects.get(pk=self.pk)
+			pilgrim.miles = 10
+			Pilgrim.objects.filter(pk=self.pk).update(name='Kassapa')
+			pilgrim.refresh_from_db(fields=['name'])
+			
+			self.assertEquals((pilgrim.name, pilgrim.miles), ('Kassapa', 10))
+			self.assertEquals(pilgrim.changed_fields, {'miles'})
+			
+			pilgrim.save()
+			
+			Pilgrim.objects.filter(pk=self.pk).update(name='Upali')
+			pilgrim.refresh_from_db()
+			
+			self.assertEquals((pilgrim.name, pilgrim.miles), ('Upali', 10))
+			self.assertIs(Pilgrim.objects.get(pk=self.pk), pilgrim)
+	
+	def test_filtered_get_queries(self):
+		with identity_map():
+			pilgrim = Pilgrim.objects.get(pk=self.pk)
+			
+			self.assertRaises(Pilgrim.DoesNotExist, Pilgrim.objects.filter(name='Kassapa').get, pk=self.pk)
+			
+			pilgrim.delete()
+			
+			self.assertRaises(Pilgrim.DoesNotExist, Pilgrim.objects.get, pk=self.pk)
+	
+	def test_middleware(self):
+		middleware = IdentityMapMiddleware(lambda request: (Pilgrim.objects.get(pk=self.pk), Pilgrim.objects.get(pk=self.pk)))
+		first, second = middleware(None)
+		
+		self.assertIs(first, second)
+		self.assertIsNot(middleware(None)[0], first)
+
+
+class WastedWritesTestCase(TestCase):
+	def test_counts_wasted_columns(self):
+		Ascetic.objects.create(name='Angulimala')
+		
+		with WastedWrites() as wasted_writes:
+			ascetic = Ascetic.objects.get()
+			ascetic.vows = 5
+			ascetic.save()
+			ascetic.save()
+			ascetic.save(update_fields=['vows'])
+			Ascetic.objects.create(name='Upali')
+			
+			pilgrim = Pilgrim.objects.create(external_id=0, name='Ananda')
+			pilgrim.miles = 10
+			pilgrim.save()
+		
+		ascetic.save()
+		
+		self.assertEquals(wasted_writes.report(), [(Ascetic, 2, 6, 1, 5)])
+		self.assertIn('testapp.Ascetic', wasted_writes.format_report())
+
+
+class SaveAssertionsTestCase(SaveAssertionsMixin, TestCase):
+	def setUp(self):
+		super(SaveAssertionsTestCase, self).setUp()
+		
+		for external_id, name in enumerate(('Ananda', 'Kassapa')):
+			Pilgrim.objects.create(external_id=external_id, name=name)
+	
+	def test_assert_saves_fields(self):
+		pilgrim = Pilgrim.objects.get(external_id=0)
+		pilgrim.miles = 10
+		
+		self.assertSavesFields(pilgrim, {'miles'})
+		
+		pilgrim.name = 'Mahakassapa'
+		
+		with self.assertRaises(AssertionError):
+			self.assertSavesFields(pilgrim, {'name', 'miles'})
+	
+	def test_assert_no_save(self):
+		pilgrim = Pilgrim.objects.get(external_id=0)
+		
+		self.assertNoSave(pilgrim)
+		
+		pilgrim.miles = 10
+		
+		with self.assertRaises(AssertionError):
+			self.assertNoSave(pilgrim)
+	
+	def test_assert_num_columns_written(self):
+		pilgrims = list(Pilgrim.objects.order_by('external_id'))
+		pilgrims[0].miles = 10
+		pilgrims[1].miles = 20
+		
+		with self.assertNumColumnsWritten(1):
+			bulk_save(pilgrims)
+		
+		pilgrims[0].name = 'Sariputta'
+		
+		self.assertNumColumnsWritten(1, pilgrims[0].save)
+		self.assertNumColumnsWritten(3, Pilgrim.objects.filter(pk=pilgrims[0].pk).update, external_id=5, name='Moggallana', miles=0)
+	
+	def test_columns_written_in_logged_queries(self):
+		update = 'UPDATE "testapp_pilgrim" SET "name" = %s, "miles" = %s WHERE "testapp_pilgrim"."id" = %s'
+		
+		self.assertEquals(_columns_written(connection, update), 2)
+		self.assertEquals(_columns_written(connection, "QUERY = u'%s' - PARAMS = ('Sariputta', 10, 1)" % update), 2)
+		self.assertEquals(_columns_written(connection, 'SELECT "update" FROM "testapp_pilgrim"'), 0)
+
+
+class BufferedCountersTestCase(TestCase):
+	def setUp(self):
+		super(BufferedCountersTestCase, self).setUp()
+		
+		self.shrines = [Shrine.objects.create(name=name) for name in ('Bodh Gaya', 'Sarnath', 'Kushinagar')]
+	
+	def tearDown(self):
+		buffering.BUFFER.deltas.clear()
+		
+		super(BufferedCountersTestCase, self).tearDown()
+	
+	def visit(self, pk, visits=1, offerings=0):
+		shrine = Shrine.objects.get(pk=pk)
+		shrine.visits += visits
+		shrine.offerings += offerings
+		shrine.save()
+		
+		return shrine
+	
+	def test_counter_saves_buffered(self):
+		with self.assertNumQueries(2):
+			self.visit(self.shrines[0].pk)
+			self.visit(self.shrines[0].pk)
+		
+		with self.assertNumQueries(1):
+			self.assertEquals(buffering.BUFFER.flush(), 1)
+		
+		self.assertEquals(Shrine.objects.get(pk=self.shrines[0].pk).visits, 2)
+		self.assertEquals(Shrine.objects.get(pk=self.shrines[1].pk).visits, 0)
+	
+	def test_flush_groups_equal_increments(self):
+		for shrine in self.shrines:
+			self.visit(shrine.pk, offerings=5)
+		
+		self.visit(self.shrines[2].pk)
+		
+		with self.assertNumQueries(2):
+			buffering.BUFFER.flush()
+		
+		self.assertEquals(list(Shrine.objects.order_by('pk').values_list('visits', 'offerings')), [(1, 5), (1, 5), (2, 5)])
+	
+	def test_other_changes_saved(self):
+		shrine = Shrine.objects.get(pk=self.shrines[0].pk)
+		shrine.visits += 1
+		shrine.name = 'Lumbini'
+		
+		self.assertNumQueries(1, shrine.save)
+		self.assertFalse(buffering.BUFFER.deltas)
+		self.assertEquals(Shrine.objects.get(pk=shrine.pk).visits, 1)
+	
+	def test_other_changes_saved_after_buffered(self):
+		shrine = self.visit(self.shrines[0].pk)
+		shrine.visits += 1
+		shrine.name = 'Lumbini'
+		shrine.save()
+		
+		self.assertEquals(shrine.visits, 2)
+		self.assertEquals(buffering.BUFFER.flush(), 1)
+		self.assertEquals(Shrine.objects.get(pk=shrine.pk).visits, 2)
+	
+	def test_failed_batch_puts_back_only_unwritten(self):
+		for shrine in self.shrines:
+			self.visit(shrine.pk)
+		
+		update = models.QuerySet.update
+		updates = []
+		
+		def failing_update(queryset, **kwargs):
+			updates.append(kwargs)
+			
+			if len(updates) == 2:
+				raise IntegrityError('Failed.')
+			
+			return update(queryset, **kwargs)
+		
+		connection.ops.bulk_batch_size = lambda fields, objs: 1
+		models.QuerySet.update = failing_update
+		
+		try:
+			self.assertRaises(IntegrityError, buffering.BUFFER.flush)
+		
+		finally:
+			del(connection.ops.bulk_batch_size)
+			models.QuerySet.update = update
+		
+		self.assertEquals(buffering.BUFFER.flush(), 2)
+		self.assertEquals(list(Shrine.objects.values_list('visits', flat=True)), [1, 1, 1])
+
+
+class CounterBufferThreadTestCase(TransactionTestCase):
+	def test_stop_flushes(self):
+		shrine = Shrine.objects.create(name='Bodh Gaya')
+		counter_buffer = CounterBuffer(interval=60)
+		counter_buffer.add(Shrine, 'default', shrine.pk, {'visits': 3})
+		
+		self.assertTrue(counter_buffer.thread.is_alive())
+		
+		counter_buffer.stop()
+		
+		self.assertIsNone(counter_buffer.thread)
+		self.assertEquals(Shrine.objects.get(pk=shrine.pk).visits, 3)
+
+
+class AppendableTestCase(TestCase):
+	def setUp(self):
+		super(AppendableTestCase, self).setUp()
+		
+		self.chronicle = Chronicle.objects.create(title='Mahavamsa', chronicle='In the beginning.')
+	
+	def save_capturing_sql(self):
+		with CaptureQueriesContext(connection) as queries:
+			self.chronicle.save()
+		
+		self.assertEquals(len(queries), 1)
+		
+		return queries[0]['sql']
+	
+	def test_append_sends_suffix(self):
+		self.chronicle.chronicle += ' Then the king.'
+		sql = self.save_capturing_sql()
+		
+		self.assertIn("' Then the king.'", sql)
+		self.assertNotIn('In the beginning.', sql)
+		self.assertEquals(self.chronicle.chronicle, 'In the beginning. Then the king.')
+		self.assertEquals(self.chronicle.changed_fields, set())
+		self.assertEquals(Chronicle.objects.get(pk=self.chronicle.pk).chronicle, 'In the beginning. Then the king.')
+	
+	def test_other_changes_send_value(self):
+		self.chronicle.chronicle = 'In the end.'
+		
+		self.assertIn("'In the end.'", self.save_capturing_sql())
+		self.assertEquals(Chronicle.objects.get(pk=self.chronicle.pk).chronicle, 'In the end.')
+	
+	def test_signals_see_values(self):
+		seen = []
+		
+		def receiver(sender, instance, **kwargs):
+			seen.append((instance.chronicle, instance.changed_fields))
+		
+		models.signals.pre_save.connect(receiver, sender=Chronicle)
+		models.signals.post_save.connect(receiver, sender=Chronicle)
+		
+		try:
+			self.chronicle.chronicle += ' Then the king.'
+			
+			self.assertIn("' Then the king.'", self.save_capturing_sql())
+		
+		finally:
+			models.signals.pre_save.disconnect(receiver, sender=Chronicle)
+			models.signals.post_save.disconnect(receiver, sender=Chronicle)
+		
+		self.assertEquals(seen, [('In the beginning. Then the king.', {'chronicle'})] * 2)
+	
+	def test_bulk_save_appends(self):
+		other = Chronicle.objects.create(title='Dipavamsa', chronicle='Long ago.')
+		self.chronicle.chronicle += ' Then the king.'
+		other.chronicle += ' Then the island.'
+		Chronicle.objects.update(chronicle=Concat('chronicle', Value(' Meanwhile.')))
+		
+		bulk_save([self.chronicle, other])
+		
+		self.assertEquals(
+			list(Chronicle.objects.order_by('pk').values_list('chronicle', flat=True)),
+			['In the beginning. Meanwhile. Then the king.', 'Long ago. Meanwhile. Then the island.']
+		)
+		self.assertEquals(self.chronicle.chronicle, 'In the beginning. Then the king.')
+
+
+class TrackedIteratorTestCase(TestCase):
+	def setUp(self):
+		super(TrackedIteratorTestCase, self).setUp()
+		
+		Pilgrim.objects.bulk_create([Pilgrim(external_id=external_id, name='Pilgrim %d' % external_id) for external_id in range(25)])
+	
+	def test_changes_are_written_per_chunk(self):
+		seen = []
+		
+		with self.assertNumQueries(6):
+			for pilgrim in Pilgrim.objects.tracked_iterator(chunk_size=10):
+				seen.append(pilgrim.external_id)
+				
+				if pilgrim.external_id % 2:
+					pilgrim.miles = pilgrim.external_id
+		
+		self.assertEquals(seen, list(range(25)))
+		self.assertEquals(
+			list(Pilgrim.objects.filter(miles__gt=0).order_by('external_id').values_list('miles', flat=True)),
+			list(range(1, 25, 2))
+		)
+	
+	def test_ordered_querysets_are_refused(self):
+		with self.assertRaises(TypeError):
+			next(Pilgrim.objects.order_by('-external_id').tracked_iterator())
+	
+	def test_unchanged_instances_are_not_written(self):
+		with self.assertNumQueries(3):
+			for pilgrim in Pilgrim.objects.filter(external_id__lt=20).tracked_iterator(chunk_size=10):
+				pilgrim.name = pilgrim.name
+	
+	def test_flush_every(self):
+		with CaptureQueriesContext(connection) as context:
+			for pilgrim in Pilgrim.objects.tracked_iterator(chunk_size=10, flush_every=5):
+				pilgrim.miles = 1
+		
+		self.assertEquals(len([query for query in context.captured_queries if _UPDATE.match(query['sql'])]), 5)
+		self.assertEquals(Pilgrim.objects.filter(miles=1).count(), 25)
+
+
+class ParallelBulkSaveTestCase(TransactionTestCase):
+	def test_partitions_written_concurrently(self):
+		for external_id in range(20):
+			Pilgrim.objects.create(external_id=external_id, name='Pilgrim %d' % external_id)
+		
+		pilgrims = list(Pilgrim.objects.all())
+		
+		for pilgrim in pilgrims:
+			pilgrim.miles = pilgrim.external_id * 10
+		
+		pilgrims.append(Pilgrim(external_id=20, name='Pilgrim 20'))
+		
+		written, failures = parallel_bulk_save(pilgrims, workers=3, partition_size=5)
+		
+		# SQLite's shared cache in memory database can refuse concurrent
+		# writers outright, rather than waiting, but the failed partitions
+		# keep their changes and can just be saved again.
+		for instances, exception in failures:
+			self.assertIsInstance(exception, OperationalError)
+			self.assertTrue(all(instance.has_changed or instance._state.adding for instance in instances))
+			
+			written += parallel_bulk_save(instances, workers=1)[0]
+		
+		self.assertEquals(written, 20)
+		self.assertEquals(list(Pilgrim.objects.order_by('external_id').values_list('miles', flat=True)), [external_id * 10 for external_id in range(20)] + [0])
+	
+	def test_new_instances_partitioned(self):
+		save_partition = bulk._save_partition
+		sizes = []
+		
+		def recording_save_partition(partition):
+			sizes.append(len(partition[2]))
+			
+			return save_partition(partition)
+		
+		bulk._save_partition = recording_save_partition
+		
+		try:
+			written, failures = parallel_bulk_save([Pilgrim(external_id=external_id, name='Pilgrim %d' % external_id) for external_id in range(5)], workers=1, partition_size=2)
+		
+		finally:
+			bulk._save_partition = save_partition
+		
+		self.assertEquals((written, failures), (5, []))
+		self.assertEquals(sizes, [2, 2, 1])
+		self.assertEquals(Pilgrim.objects.count(), 5)
+	
+	def test_failed_new_instances_can_be_saved_again(self):
+		pilgrim = Pilgrim(external_id=0, name='Ananda')
+		
+		def receiver(**kwargs):
+			raise IntegrityError('Failed.')
+		
+		models.signals.post_save.connect(receiver, sender=Pilgrim)
+		
+		try:
+			written, failures = parallel_bulk_save([pilgrim], workers=1)
+		
+		finally:
+			models.signals.post_save.disconnect(receiver, sender=Pilgrim)
+		
+		self.assertEquals((written, len(failures)), (0, 1))
+		self.assertTrue(pilgrim._state.adding)
+		self.assertIsNone(pilgrim.pk)
+		self.assertEquals(parallel_bulk_save([pilgrim], workers=1), (1, []))
+		self.assertEquals(list(Pilgrim.objects.values_list('pk', 'name')), [(pilgrim.pk, 'Ananda')])
+
+
+class RowVersionTestCase(TestCase):
+	def setUp(self):
+		super(RowVersionTestCase, self).setUp()
+		
+		self.sangha = Sangha.objects.create(name='Veluvana')
+	
+	def test_save_increments_version(self):
+		self.assertEquals(self.sangha.version, 1)
+		
+		Sangha.objects.filter(pk=self.sangha.pk).update(version=5)
+		
+		self.sangha.members = 10
+		self.sangha.save()
+		self.assertNumQueries(0, self.sangha.save)
+		
+		self.assertEquals(self.sangha.version, 2)
+		self.assertEquals(Sangha.objects.values_list('members', 'version').get(pk=self.sangha.pk), (10, 6))
+	
+	def test_refresh_if_stale(self):
+		self.sangha.members = 10
+		
+		with self.assertNumQueries(1):
+			self.assertFalse(self.sangha.refresh_if_stale())
+		
+		self.assertEquals(self.sangha.changed_fields, {'members'})
+		
+		other = Sangha.objects.get(pk=self.sangha.pk)
+		other.name = 'Jetavana'
+		other.members = 5
+		other.save()
+		
+		with self.assertNumQueries(2):
+			self.assertTrue(self.sangha.refresh_if_stale(fields=['name']))
+		
+		self.assertEquals((self.sangha.name, self.sangha.members, self.sangha.version), ('Jetavana', 10, 1))
+		self.assertEquals(self.sangha.changed_fields, {'members'})
+		self.assertTrue(self.sangha.refresh_if_stale())
+		self.assertEquals((self.sangha.members, self.sangha.version), (5, 2))
+		self.assertFalse(self.sangha.refresh_if_stale())
+	
+	def test_bulk_save_increments_version(self):
+		first = Sangha.objects.get(pk=self.sangha.pk)
+		second = Sangha.objects.get(pk=self.sangha.pk)
+		first.members = 10
+		second.name = 'Jetavana'
+		
+		bulk_save([first])
+		bulk_save([second])
+		
+		self.assertEquals(Sangha.objects.values_list('version', flat=True).get(pk=self.sangha.pk), 3)
+		self.assertTrue(first.refresh_if_stale())
+		self.assertEquals((first.name, first.members), ('Jetavana', 10))
+	
+	def test_save_records_increments_version(self):
+		record = TrackedRecord.for_model(Sangha, ['id', 'members', 'version'])((self.sangha.pk, 0, 5))
+		record.members = 10
+		Sangha.objects.filter(pk=self.sangha.pk).update(version=5)
+		
+		save_records([record])
+		
+		self.assertEquals(record.version, 6)
+		self.assertEquals(Sangha.objects.values_list('members', 'version').get(pk=self.sangha.pk), (10, 6))
+	
+	def test_post_save_sees_version(self):
+		versions = []
+		
+		def receiver(sender, instance, **kwargs):
+			versions.append(instance.version)
+		
+		models.signals.post_save.connect(receiver, sender=Sangha)
+		
+		try:
+			self.sangha.members = 10
+			self.sangha.save()
+		
+		finally:
+			models.signals.post_save.disconnect(receiver, sender=Sangha)
+		
+		self.assertEquals(versions, [2])
+
+
+class PilgrimForm(TrackedModelFormMixin, forms.ModelForm):
+	class Meta:
+		model = Pilgrim
+		fields = ('external_id', 'name', 'miles')
+
+
+class TrackedModelFormTestCase(TestCase):
+	def setUp(self):
+		super(TrackedModelFormTestCase, self).setUp()
+		
+		self.pilgrim = Pilgrim.objects.create(external_id=0, name='Ananda')
+	
+	def test_assigns_only_changed_fields(self):
+		form = PilgrimForm({'external_id': '0', 'name': 'Ananda', 'miles': '10'}, instance=self.pilgrim)
+		assigned = []
+		
+		# Model.full_clean assigns every field itself, so we only count what
+		# the form assigns.
+		self.pilgrim.full_clean = lambda **kwargs: None
+		
+		def __setattr__(instance, name, value):
+			assigned.append(name)
+			models.Model.__setattr__(instance, name, value)
+		
+		Pilgrim.__setattr__ = __setattr__
+		
+		try:
+			self.assertTrue(form.is_valid())
+		
+		finally:
+			del(Pilgrim.__setattr__)
+		
+		self.assertEquals(assigned, ['miles'])
+		self.assertEquals(form.instance.changed_fields, {'miles'})
+		
+		del(self.pilgrim.full_clean)
+		form.save()
+		
+		self.assertEquals(Pilgrim.objects.values_list('name', 'miles').get(pk=self.pilgrim.pk), ('Ananda', 10))
+	
+	def test_unchanged_fields_not_read(self):
+		pilgrim = Pilgrim.objects.get(pk=self.pilgrim.pk)
+		form = PilgrimForm({'external_id': '0', 'name': 'Ananda', 'miles': '10'}, instance=pilgrim)
+		
+		# The form's initial data is read from the instance when it's built,
+		# which isn't ours to change.
+		pilgrim._mutability_checked = set()
+		
+		self.assertTrue(form.is_valid())
+		self.assertEquals(pilgrim._mutability_checked & {'external_id', 'name'}, set())
+		self.assertEquals(pilgrim.changed_fields, {'miles'})
+	
+	def test_deferred_fields_compared(self):
+		pilgrim = Pilgrim.objects.only('external_id').get(pk=self.pilgrim.pk)
+		form = PilgrimForm({'external_id': '0', 'name': 'Ananda', 'miles': '10'}, instance=pilgrim)
+		
+		self.assertTrue(form.is_valid())
+		self.assertEquals(pilgrim.changed_fields, {'miles'})
+	
+	def test_assigns_explicit_initial(self):
+		form = PilgrimForm({'external_id': '0', 'name': 'Kassapa', 'miles': '0'}, instance=self.pilgrim, initial={'name': 'Kassapa'})
+		
+		self.assertTrue(form.is_valid())
+		self.assertEquals(form.instance.changed_fields, {'name'})
+	
+	def test_assigns_values_matching_prefilled_initial(self):
+		class SuggestingPilgrimForm(PilgrimForm):
+			def __init__(self, *args, **kwargs):
+				super(SuggestingPilgrimForm, self).__init__(*args, **kwargs)
+				
+				self.initial['name'] = 'Suggested'
+		
+		form = SuggestingPilgrimForm({'external_id': '0', 'name': 'Suggested', 'miles': '0'}, instance=self.pilgrim)
+		
+		self.assertTrue(form.is_valid())
+		self.assertEquals(form.instance.changed_fields, {'name'})
+		
+		form.save()
+		
+		self.assertEquals(Pilgrim.objects.get(pk=self.pilgrim.pk).name, 'Suggested')
+
+
+class ChangedOnlyValidationTestCase(TestCase):
+	def setUp(self):
+		super(ChangedOnlyValidationTestCase, self).setUp()
+		
+		self.pilgrim = Pilgrim.objects.create(external_id=0, name='Ananda')
+		Pilgrim.objects.create(external_id=1, name='Kassapa')
+		self.precept = Precept.objects.create(school='Theravada', number=1, text='Harmlessness')
+		Precept.objects.create(school='Mahayana', number=1, text='Harmlessness')
+	
+	def test_unchanged_instance_skips_unique_checks(self):
+		with self.assertNumQueries(1):
+			self.pilgrim.full_clean()
+		
+		with self.assertNumQueries(0):
+			self.pilgrim.full_clean(changed_only=True)
+		
+		self.pilgrim.name = 'Upali'
+		
+		with self.assertNumQueries(0):
+			self.pilgrim.full_clean(changed_only=True)
+	
+	def test_changed_unique_field_is_checked(self):
+		self.pilgrim.external_id = 1
+		
+		with self.assertNumQueries(1):
+			with self.assertRaises(ValidationError) as context:
+				self.pilgrim.full_clean(changed_only=True)
+		
+		self.assertEquals(set(context.exception.message_dict), {'external_id'})
+	
+	def test_unique_together_with_one_changed_field_is_checked(self):
+		self.precept.text = 'Truthfulness'
+		
+		with self.assertNumQueries(0):
+			self.precept.full_clean(changed_only=True)
+		
+		self.precept.school = 'Mahayana'
+		
+		with self.assertNumQueries(1):
+			with self.assertRaises(ValidationError) as context:
+				self.precept.full_clean(changed_only=True)
+		
+		self.assertEquals(set(context.exception.message_dict), {'__all__'})
+	
+	def test_unchanged_fields_are_not_validated(self):
+		self.pilgrim.__dict__['name'] = 'Ananda' * 10
+		
+		self.pilgrim.full_clean(changed_only=True)
+		
+		with self.assertRaises(ValidationError):
+			self.pilgrim.full_clean()
+		
+		self.pilgrim.miles = 'far'
+		
+		with self.assertRaises(ValidationError) as context:
+			self.pilgrim.full_clean(changed_only=True)
+		
+		self.assertEquals(set(context.exception.message_dict), {'miles'})
+	
+	def test_new_instance_is_fully_validated(self):
+		with self.assertRaises(ValidationError) as context:
+			Pilgrim(external_id=1, name='Upali').full_clean(changed_only=True)
+		
+		self.assertEquals(set(context.exception.message_dict), {'external_id'})
+	
+	def test_form_only_validates_changed_fields(self):
+		form = PilgrimForm({'external_id': '0', 'name': 'Ananda', 'miles': '10'}, instance=self.pilgrim)
+		
+		with self.assertNumQueries(0):
+			self.assertTrue(form.is_valid())
+		
+		form = PilgrimForm({'external_id': '1', 'name': 'Ananda', 'miles': '0'}, instance=Pilgrim.objects.get(pk=self.pilgrim.pk))
+		
+		self.assertFalse(form.is_valid())
+		self.assertEquals(set(form.errors), {'external_id'})
+
+
+@skipIf(sys.version_info < (3, 5), "Async saves need Python 3.5+.")
+class AsyncTestCase(TransactionTestCase):
+	def setUp(self):
+		super(AsyncTestCase, self).setUp()
+		
+		for external_id, name in enumerate(('Ananda', 'Kassapa')):
+			Pilgrim.objects.create(external_id=external_id, name=name)
+		
+		self.loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(self.loop)
+	
+	def tearDown(self):
+		self.loop.close()
+		
+		super(AsyncTestCase, self).tearDown()
+	
+	def assertCompletesImmediately(self, coroutine):
+		with self.assertRaises(StopIteration) as context:
+			coroutine.send(None)
+		
+		return context.exception.value
+	
+	def test_asave_without_changes_stays_on_loop(self):
+		pilgrim = Pilgrim.objects.get(external_id=0)
+		
+		self.assertCompletesImmediately(pilgrim.asave())
+	
+	def test_asave_writes_changed_fields(self):
+		pilgrim = Pilgrim.objects.get(external_id=0)
+		pilgrim.miles = 10
+		Pilgrim.objects.filter(pk=pilgrim.pk).update(name='Mahakassapa')
+		
+		self.loop.run_until_complete(pilgrim.asave())
+		
+		self.assertEquals(pilgrim.changed_fields, set())
+		self.assertEquals(Pilgrim.objects.values_list('name', 'miles').get(pk=pilgrim.pk), ('Mahakassapa', 10))
+	
+	def test_abulk_save(self):
+		pilgrims = list(Pilgrim.objects.order_by('external_id'))
+		
+		self.assertEquals(self.assertCompletesImmediately(asynchronous.abulk_save(pilgrims)), 0)
+		
+		pilgrims[1].miles = 20
+		
+		self.assertEquals(self.loop.run_until_complete(asynchronous.abulk_save(pilgrims)), 1)
+		self.assertEquals(list(Pilgrim.objects.order_by('external_id').values_list('miles', flat=True)), [0, 20])
+	
+	def test_refused_in_atomic_block(self):
+		pilgrim = Pilgrim.objects.get(external_id=0)
+		pilgrim.miles = 10
+		
+		with transaction.atomic():
+			self.assertRaises(TransactionManagementError, self.loop.run_until_complete, pilgrim.asave())
+			self.assertRaises(TransactionManagementError, self.loop.run_until_complete, asynchronous.abulk_save([pilgrim]))
+		
+		self.assertEquals(pilgrim.changed_fields, {'miles'})
+		self.assertEquals(Pilgrim.objects.get(pk=pilgrim.pk).miles, 0)
+	
+	def test_asave_sends_expressions(self):
+		chronicle = Chronicle.objects.create(title='Mahavamsa', chronicle='In the beginning.')
+		chronicle.chronicle += ' Then the king.'
+		Chronicle.objects.filter(pk=chronicle.pk).update(chronicle='In the beginning. Meanwhile.')
+		
+		sangha = Sangha.objects.create(name='Veluvana')
+		sangha.members = 10
+		Sangha.objects.filter(pk=sangha.pk).update(version=5)
+		
+		self.loop.run_until_complete(chronicle.asave())
+		self.loop.run_until_complete(sangha.asave())
+		
+		self.assertEquals(Chronicle.objects.get(pk=chronicle.pk).chronicle, 'In the beginning. Meanwhile. Then the king.')
+		self.assertEquals(Sangha.objects.values_list('members', 'version').get(pk=sangha.pk), (10, 6))